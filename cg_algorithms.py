@@ -131,6 +131,54 @@ def draw_polygon(p_list, algorithm):
     return result
 
 
+def fill_polygon(p_list):
+    """扫描线算法填充多边形（有序边表与活动边表）
+
+    像素中心（整数坐标）位于多边形内部的像素被填充（奇偶规则），恰好落在边上的像素只计入左边与上边，
+    因此相邻的多边形互不重叠。每条扫描线的结果为若干水平线段，不逐个输出像素
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 多边形的顶点坐标列表
+    :return: (list of list of int: [[y, x_start, x_end], ...]) 填充结果的水平线段列表，每段包含x_start到x_end（含）的像素，
+        按y、x_start升序排列
+    """
+    # 边表：按下端点y坐标分桶，每条边为[分子, dx, dy, y_max]，与扫描线y的交点x = 分子 / dy，边覆盖y_min <= y < y_max的扫描线
+    edge_table = {}
+    for i in range(len(p_list)):
+        x0, y0 = p_list[i - 1]
+        x1, y1 = p_list[i]
+        if y0 == y1:
+            continue  # 水平边不与扫描线相交
+        if y0 > y1:
+            x0, y0, x1, y1 = x1, y1, x0, y0
+        edge_table.setdefault(y0, []).append([x0 * (y1 - y0), x1 - x0, y1 - y0, y1])
+    if not edge_table:
+        return []
+    starts = sorted(edge_table)
+    result = []
+    active = []
+    k = 0
+    y = starts[0]
+    while k < len(starts) or active:
+        if not active:
+            y = starts[k]  # 跳过中间没有活动边的扫描线
+        if k < len(starts) and starts[k] == y:
+            active += edge_table[starts[k]]
+            k += 1
+        active = [edge for edge in active if edge[3] > y]
+        # 交点以整数分子/分母精确表示，只在排序时转为浮点数；各边的交点逐线增加dx，排序的输入几乎有序
+        active.sort(key=lambda edge: edge[0] / edge[2])
+        for j in range(0, len(active) - 1, 2):
+            left, right = active[j], active[j + 1]
+            x_start = -(-left[0] // left[2])  # 交点向上取整：中心恰在左边上的像素计入
+            x_end = -(-right[0] // right[2]) - 1  # 中心恰在右边上的像素不计入
+            if x_start <= x_end:
+                result.append([y, x_start, x_end])
+        for edge in active:
+            edge[0] += edge[1]
+        y += 1
+    return result
+
+
 def draw_ellipse(p_list):
     """绘制椭圆（采用中点圆生成算法）
 
@@ -144,75 +192,151 @@ def draw_ellipse(p_list):
     core_y = int((y0 + y1) / 2)
     a = int(abs(x0 - x1) / 2)
     b = int(abs(y0 - y1) / 2)
+    for x, y in ellipse_quadrant(a, b):
+        result.append([core_x + x, core_y + y])
+        if x != 0:
+            result.append([core_x - x, core_y + y])
+        if y != 0:
+            result.append([core_x + x, core_y - y])
+            if x != 0:
+                result.append([core_x - x, core_y - y])
+    return result
+
+
+def ellipse_quadrant(a, b):
+    """中点椭圆生成算法计算中心在原点的椭圆第一象限（含坐标轴上的端点）的像素点，各点互不相同
+
+    决策参数均乘以4，全程使用整数运算
+
+    :param a: (int) x方向半轴长
+    :param b: (int) y方向半轴长
+    :return: (list of list of int: [[x_0, y_0], [x_1, y_1], ...]) 像素点坐标列表
+    """
     a_2 = a ** 2
     b_2 = b ** 2
     x_k = 0
     y_k = b
-    result.append([core_x, core_y + b])
-    result.append([core_x, core_y - b])
-    result.append([core_x + a, core_y])
-    result.append([core_x - a, core_y])
+    result = [[x_k, y_k]]
 
-    p_k = b_2 - a_2 * b + a_2 / 4
+    p_k = 4 * b_2 - 4 * a_2 * b + a_2
     while b_2 * x_k < a_2 * y_k:
         if p_k < 0:
-            p_k += 2 * b_2 * x_k + 3 * b_2
+            p_k += 8 * b_2 * x_k + 12 * b_2
         else:
-            p_k += 2 * b_2 * x_k + 3 * b_2 - 2 * a_2 * y_k + 2 * a_2
+            p_k += 8 * b_2 * x_k + 12 * b_2 - 8 * a_2 * y_k + 8 * a_2
             y_k -= 1
         x_k += 1
-        result.append((core_x + x_k, core_y + y_k))
-        result.append((core_x - x_k, core_y + y_k))
-        result.append((core_x + x_k, core_y - y_k))
-        result.append((core_x - x_k, core_y - y_k))
+        result.append([x_k, y_k])
 
-    p_k = b_2 * (x_k + 1 / 2) ** 2 + a_2 * (y_k - 1) ** 2 - a_2 * b_2
+    p_k = b_2 * (2 * x_k + 1) ** 2 + 4 * a_2 * (y_k - 1) ** 2 - 4 * a_2 * b_2
     while y_k > 0:
         if p_k > 0:
-            p_k += -2 * a_2 * y_k + 3 * a_2
+            p_k += -8 * a_2 * y_k + 12 * a_2
         else:
-            p_k += 2 * b_2 * x_k + 3 * a_2 - 2 * a_2 * y_k + 2 * b_2
+            p_k += 8 * b_2 * x_k + 12 * a_2 - 8 * a_2 * y_k + 8 * b_2
             x_k += 1
         y_k -= 1
-        result.append((core_x + x_k, core_y + y_k))
-        result.append((core_x - x_k, core_y + y_k))
-        result.append((core_x + x_k, core_y - y_k))
-        result.append((core_x - x_k, core_y - y_k))
+        result.append([x_k, y_k])
 
+    if result[-1] != [a, 0]:
+        result.append([a, 0])
     return result
 
 
-def draw_curve(p_list, algorithm):
+def draw_curve(p_list, algorithm, adaptive=False):
     """绘制曲线
 
     :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 曲线的控制点坐标列表
     :param algorithm: (string) 绘制使用的算法，包括'Bezier'和'B-spline'（三次均匀B样条曲线，曲线不必经过首末控制点）
+    :param adaptive: (bool) 是否按曲线尺寸自适应选取采样数（相邻采样点以线段连接），默认固定采样1000次
     :return: (list of list of int: [[x_0, y_0], [x_1, y_1], [x_2, y_2], ...]) 绘制结果的像素点坐标列表
     """
     result = []
-    if algorithm == 'Bezier':
+    if adaptive:
+        result = adaptive_curve(p_list, algorithm)
+    elif algorithm == 'Bezier':
         result = bezier_curve(p_list)
     elif algorithm == 'B-spline':
         result = bspline_curve(p_list)
     return result
 
 
+def adaptive_curve(p_list, algorithm, step=2):
+    """自适应采样绘制曲线
+
+    Bezier曲线与B样条曲线的长度均不超过控制多边形的长度，按控制多边形长度选取采样数，
+    使相邻采样点间的曲线长度不超过step个像素，再以Bresenham线段依次连接采样点，结果无间隙且不含重复像素
+
+    :param step: (int) 相邻采样点间曲线长度的上界（像素）
+    """
+    n = len(p_list)
+    if algorithm == 'B-spline' and n < 4:
+        return []
+    length = sum(math.hypot(p_list[i][0] - p_list[i - 1][0], p_list[i][1] - p_list[i - 1][1]) for i in range(1, n))
+    count = max(1, math.ceil(length / step))
+    samples = []
+    for s in range(count + 1):
+        if algorithm == 'Bezier':
+            x, y = bezier_point(p_list, s / count)
+        elif algorithm == 'B-spline':
+            x, y = bspline_point(p_list, 3 + (n - 3) * s / count)
+        else:
+            return []
+        samples.append([round(x), round(y)])
+    result = [samples[0]]
+    seen = {tuple(samples[0])}
+    for i in range(1, len(samples)):
+        if samples[i] == samples[i - 1]:
+            continue
+        for p in draw_line([samples[i - 1], samples[i]], 'Bresenham'):
+            if tuple(p) not in seen:
+                seen.add(tuple(p))
+                result.append(p)
+    return result
+
+
+def bezier_point(p_list, u):
+    """de Casteljau算法计算Bezier曲线在参数u处的点"""
+    xs = [p[0] for p in p_list]
+    ys = [p[1] for p in p_list]
+    v = 1 - u
+    for i in range(len(p_list) - 1, 0, -1):
+        for j in range(i):
+            xs[j] = v * xs[j] + u * xs[j + 1]
+            ys[j] = v * ys[j] + u * ys[j + 1]
+    return xs[0], ys[0]
+
+
+def bspline_point(p_list, u):
+    """计算三次均匀B样条曲线在参数u（3 <= u <= n）处的点"""
+    k = 4
+    j = min(int(u), len(p_list) - 1)
+    basis = de_boor_cox_span(j, k, u)
+    x, y = 0, 0
+    for i in range(k):
+        x0, y0 = p_list[j - k + 1 + i]
+        x += x0 * basis[i]
+        y += y0 * basis[i]
+    return x, y
+
+
 def bezier_curve(p_list):
     result = []
     n = len(p_list) - 1
     result.append(p_list[0])
+    # de Casteljau算法在同一组坐标上原地逐层计算，避免每层重新分配列表
+    xs = [0.0] * (n + 1)
+    ys = [0.0] * (n + 1)
     u = 0.001
     while u < 1:
-        res = p_list.copy()
-        for i in range(n):
-            temp = []
-            for j in range(len(res) - 1):
-                x1, y1 = res[j]
-                x2, y2 = res[j + 1]
-                temp.append([(1 - u) * x1 + u * x2, (1 - u) * y1 + u * y2])
-            res = temp.copy()
-        x, y = round(res[0][0]), round(res[0][1])
-        result.append([x, y])
+        v = 1 - u
+        for j in range(n + 1):
+            xs[j], ys[j] = p_list[j]
+        for i in range(n, 0, -1):
+            for j in range(i):
+                xs[j] = v * xs[j] + u * xs[j + 1]
+                ys[j] = v * ys[j] + u * ys[j + 1]
+        result.append([round(xs[0]), round(ys[0])])
         u += 0.001
     result.append(p_list[-1])
     return result
@@ -227,12 +351,14 @@ def bspline_curve(p_list):
     u = 3
     du = 1 / 1000
     while u < n:
+        # 区间[j, j + 1)上只有N(j-3, 4)到N(j, 4)四个基函数非零，直接计算这四个值
+        j = int(u)
+        basis = de_boor_cox_span(j, k, u)
         x1, y1 = 0, 0
-        for i in range(n):
-            x0, y0 = p_list[i]
-            res = de_boor_cox(i, k, u)
-            x1 += x0 * res
-            y1 += y0 * res
+        for i in range(k):
+            x0, y0 = p_list[j - k + 1 + i]
+            x1 += x0 * basis[i]
+            y1 += y0 * basis[i]
         result.append([round(x1), round(y1)])
         u += du
     return result
@@ -244,6 +370,20 @@ def de_boor_cox(i, k, u):
     return (u - i) / (k - 1) * de_boor_cox(i, k - 1, u) + (i + k - u) / (k - 1) * de_boor_cox(i + 1, k - 1, u)
 
 
+def de_boor_cox_span(j, k, u):
+    """非递归计算j <= u < j + 1时全部非零的k阶基函数[N(j-k+1, k), ..., N(j, k)]
+
+    逐阶递推的运算与de_boor_cox相同（零项的乘积与和不改变结果），因此数值完全一致
+    """
+    basis = [0.0] * (k + 1)  # basis[t]对应N(j-k+1+t, m)，basis[k]对应恒为0的N(j+1, m)
+    basis[k - 1] = 1
+    for m in range(2, k + 1):
+        for t in range(k - m, k):
+            i = j - k + 1 + t
+            basis[t] = (u - i) / (m - 1) * basis[t] + (i + m - u) / (m - 1) * basis[t + 1]
+    return basis[:k]
+
+
 def translate(p_list, dx, dy):
     """平移变换
 
@@ -270,17 +410,14 @@ def rotate(p_list, x, y, r, unit=True):
     """
     result = []
     if unit:
-        for p in p_list:
-            x0, y0 = p[0] - x, p[1] - y
-            x_new = x0 * math.cos(r / 180 * math.pi) - y0 * math.sin(r / 180 * math.pi)
-            y_new = x0 * math.sin(r / 180 * math.pi) + y0 * math.cos(r / 180 * math.pi)
-            result.append([round(x_new) + x, round(y_new) + y])
-    else:
-        for p in p_list:
-            x0, y0 = p[0] - x, p[1] - y
-            x_new = x0 * math.cos(r) - y0 * math.sin(r)
-            y_new = x0 * math.sin(r) + y0 * math.cos(r)
-            result.append([round(x_new) + x, round(y_new) + y])
+        r = r / 180 * math.pi
+    cos_r = math.cos(r)
+    sin_r = math.sin(r)
+    for p in p_list:
+        x0, y0 = p[0] - x, p[1] - y
+        x_new = x0 * cos_r - y0 * sin_r
+        y_new = x0 * sin_r + y0 * cos_r
+        result.append([round(x_new) + x, round(y_new) + y])
     return result
 
 
@@ -318,8 +455,8 @@ def clip(p_list, x_min, y_min, x_max, y_max, algorithm):
     x1, y1 = p_list[1]
     if algorithm == 'Cohen-Sutherland':
         while True:
-            code0 = sum([1 * (x0 < x_min), 2 * (x0 > x_max), 4 * (y0 < y_min), 8 * (y0 > y_max)])
-            code1 = sum([1 * (x1 < x_min), 2 * (x1 > x_max), 4 * (y1 < y_min), 8 * (y1 > y_max)])
+            code0 = (x0 < x_min) * 1 | (x0 > x_max) * 2 | (y0 < y_min) * 4 | (y0 > y_max) * 8
+            code1 = (x1 < x_min) * 1 | (x1 > x_max) * 2 | (y1 < y_min) * 4 | (y1 > y_max) * 8
             if (code0 | code1) == 0:
                 result = [[int(x0), int(y0)], [int(x1), int(y1)]]
                 break
@@ -0,0 +1,468 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+import functools
+import math
+
+import numpy as np
+
+import cg_algorithms as alg
+
+
+# 本文件为cg_algorithms中算法的NumPy向量化实现，光栅化与变换的结果以int32坐标数组（形状为(N, 2)，每行为[x, y]）返回，
+# 像素点及其顺序与cg_algorithms中对应函数的结果完全一致（椭圆的像素点集合一致，但按象限分组排列）；
+# 光栅化结果也可以表示为水平线段数组（形状为(N, 3)，每行为[y, x_start, x_end]，包含x_start到x_end的像素），
+# 以切片赋值写入画布，较长的线段可以显著减少内存与写入的开销
+
+# DDA算法需要逐点累加浮点增量，批量处理时按长度分块，限制每块补齐后的数组大小
+_CHUNK_SIZE = 1024
+# 写入水平线段时，长度不小于该值的线段逐段以切片赋值写入，较短的线段展开为像素索引后一次写入
+_SLICE_MIN_LENGTH = 16
+
+
+def draw_lines(segments, algorithm):
+    """批量绘制线段
+
+    :param segments: (array-like of int: (N, 2, 2)) N条线段的起点和终点坐标
+    :param algorithm: (string) 绘制使用的算法，包括'DDA'和'Bresenham'，其余算法逐条调用cg_algorithms.draw_line
+    :return: (tuple: (pixels, offsets)) pixels为int32坐标数组(M, 2)，第i条线段的像素点为pixels[offsets[i]:offsets[i + 1]]
+    """
+    segments = np.asarray(segments, dtype=np.int64).reshape(-1, 2, 2)
+    n = len(segments)
+    if algorithm not in ('DDA', 'Bresenham'):
+        parts = [_as_pixels(alg.draw_line(seg.tolist(), algorithm)) for seg in segments]
+        offsets = np.zeros(n + 1, np.int64)
+        offsets[1:] = np.cumsum([len(part) for part in parts])
+        pixels = np.concatenate(parts) if parts else np.zeros((0, 2), np.int32)
+        return pixels, offsets
+
+    x0, y0 = segments[:, 0, 0], segments[:, 0, 1]
+    x1, y1 = segments[:, 1, 0], segments[:, 1, 1]
+    dx = np.abs(x1 - x0)
+    dy = np.abs(y1 - y0)
+    vertical = dx == 0
+    if algorithm == 'DDA':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            m = np.abs((y0 - y1) / (x0 - x1))
+        shallow = ~vertical & (m < 1)
+    else:
+        shallow = ~vertical & (dy < dx)
+    steep = ~shallow
+
+    # 主方向（每步变化1的坐标轴）按原算法的交换规则确定起点，以下均以(主坐标, 次坐标)描述
+    major0 = np.where(shallow, x0, y0)
+    major1 = np.where(shallow, x1, y1)
+    minor0 = np.where(shallow, y0, x0)
+    minor1 = np.where(shallow, y1, x1)
+    swap = major0 > major1
+    major0, major1 = np.where(swap, major1, major0), np.where(swap, major0, major1)
+    minor0, minor1 = np.where(swap, minor1, minor0), np.where(swap, minor0, minor1)
+    lengths = major1 - major0 + 1
+    offsets = np.zeros(n + 1, np.int64)
+    offsets[1:] = np.cumsum(lengths)
+    total = int(offsets[-1])
+    index = np.repeat(np.arange(n), lengths)
+    k = np.arange(total) - offsets[index]
+
+    if algorithm == 'DDA':
+        # 次坐标单调递减时原算法从主坐标较大的一端反向绘制
+        backward = ~vertical & (minor0 >= minor1)
+        start_major = np.where(backward, major1, major0)
+        start_minor = np.where(backward, minor1, minor0)
+        step = np.where(backward, -1, 1)
+        with np.errstate(divide='ignore'):
+            delta = np.where(vertical, 0.0, np.where(shallow, m, 1 / m))
+        major = start_major[index] + step[index] * k
+        minor = np.empty(total, np.float64)
+        _accumulate(minor, start_minor, delta, lengths, offsets)
+        minor = np.round(minor).astype(np.int64)
+    else:
+        d_major = major1 - major0
+        d_minor = np.abs(minor1 - minor0)
+        step = np.where(minor0 > minor1, -1, 1)
+        major = major0[index] + k
+        count = (2 * d_minor[index] * k + d_major[index]) // np.maximum(2 * d_major[index], 1)
+        minor = minor0[index] + step[index] * count
+
+    pixels = np.empty((total, 2), np.int32)
+    is_shallow = shallow[index]
+    pixels[:, 0] = np.where(is_shallow, major, minor)
+    pixels[:, 1] = np.where(is_shallow, minor, major)
+    return pixels, offsets
+
+
+def draw_line(p_list, algorithm):
+    """绘制线段
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1]]) 线段的起点和终点坐标
+    :param algorithm: (string) 绘制使用的算法，包括'DDA'和'Bresenham'
+    :return: (numpy.ndarray of int32: (N, 2)) 绘制结果的像素点坐标数组
+    """
+    return draw_lines([p_list], algorithm)[0]
+
+
+def draw_polygon(p_list, algorithm):
+    """绘制多边形
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 多边形的顶点坐标列表
+    :param algorithm: (string) 绘制使用的算法，包括'DDA'和'Bresenham'
+    :return: (numpy.ndarray of int32: (N, 2)) 绘制结果的像素点坐标数组
+    """
+    points = np.asarray(p_list, dtype=np.int64).reshape(-1, 2)
+    segments = np.stack([np.roll(points, 1, axis=0), points], axis=1)
+    return draw_lines(segments, algorithm)[0]
+
+
+def draw_ellipses(boxes):
+    """批量绘制椭圆
+
+    :param boxes: (array-like of int: (N, 2, 2)) N个椭圆的矩形包围框左上角和右下角顶点坐标
+    :return: (tuple: (pixels, offsets)) pixels为int32坐标数组(M, 2)，第i个椭圆的像素点为pixels[offsets[i]:offsets[i + 1]]
+    """
+    boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 2, 2)
+    centers, axes = _ellipse_params(boxes)
+    shapes = [_ellipse_shape(a, b) for a, b in axes.tolist()]
+    offsets = np.zeros(len(boxes) + 1, np.int64)
+    offsets[1:] = np.cumsum([len(shape) for shape in shapes])
+    if not shapes:
+        return np.zeros((0, 2), np.int32), offsets
+    pixels = np.concatenate(shapes) + np.repeat(centers, np.diff(offsets), axis=0)
+    return pixels.astype(np.int32), offsets
+
+
+def draw_ellipse(p_list):
+    """绘制椭圆
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1]]) 椭圆的矩形包围框左上角和右下角顶点坐标
+    :return: (numpy.ndarray of int32: (N, 2)) 绘制结果的像素点坐标数组，不含重复点
+    """
+    return draw_ellipses([p_list])[0]
+
+
+def ellipse_pixel_counts(boxes):
+    """不生成像素点，直接计算每个椭圆的像素点数（与draw_ellipses结果的长度一致）
+
+    :param boxes: (array-like of int: (N, 2, 2)) N个椭圆的矩形包围框左上角和右下角顶点坐标
+    :return: (numpy.ndarray of int64: (N,)) 像素点数
+    """
+    boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 2, 2)
+    _, axes = _ellipse_params(boxes)
+    return np.array([len(_ellipse_shape(a, b)) for a, b in axes.tolist()], np.int64)
+
+
+def _ellipse_params(boxes):
+    """计算椭圆中心与半轴长，取整方式与cg_algorithms.draw_ellipse相同"""
+    centers = np.trunc((boxes[:, 0] + boxes[:, 1]) / 2).astype(np.int64)
+    axes = np.abs(boxes[:, 0] - boxes[:, 1]) // 2
+    return centers, axes
+
+
+@functools.lru_cache(maxsize=4096)
+def _ellipse_shape(a, b):
+    """中心在原点、半轴长为a和b的椭圆的全部像素点：第一象限由整数中点算法生成，再向量化地对称到其余象限
+
+    对称时跳过坐标轴上的点，因此各点互不相同。结果只与半轴长有关，按(a, b)缓存
+    """
+    quadrant = np.array(alg.ellipse_quadrant(a, b), np.int64).reshape(-1, 2)
+    x, y = quadrant[:, 0], quadrant[:, 1]
+    sign_x, sign_y = x != 0, y != 0
+    shape = np.concatenate([
+        quadrant,
+        np.stack([-x[sign_x], y[sign_x]], axis=1),
+        np.stack([x[sign_y], -y[sign_y]], axis=1),
+        np.stack([-x[sign_x & sign_y], -y[sign_x & sign_y]], axis=1),
+    ])
+    shape.flags.writeable = False
+    return shape
+
+
+def draw_curve(p_list, algorithm):
+    """绘制曲线
+
+    :param p_list: (list of list of int: [[x0, y0], [x1, y1], [x2, y2], ...]) 曲线的控制点坐标列表
+    :param algorithm: (string) 绘制使用的算法，包括'Bezier'和'B-spline'
+    :return: (numpy.ndarray of int32: (N, 2)) 绘制结果的像素点坐标数组
+    """
+    if algorithm == 'Bezier':
+        return bezier_curve(p_list)
+    elif algorithm == 'B-spline':
+        return bspline_curve(p_list)
+    return _as_pixels(alg.draw_curve(p_list, algorithm))
+
+
+def bezier_curve(p_list):
+    """对全部参数值同时执行de Casteljau算法，浮点运算顺序与cg_algorithms.bezier_curve相同，结果逐点一致"""
+    u = _bezier_params()[:, None]
+    v = 1 - u
+    points = np.asarray(p_list, dtype=np.float64).reshape(-1, 2)
+    xs = np.repeat(points[None, :, 0], len(u), axis=0)
+    ys = np.repeat(points[None, :, 1], len(u), axis=0)
+    for i in range(len(points) - 1, 0, -1):
+        xs = v * xs[:, :i] + u * xs[:, 1:i + 1]
+        ys = v * ys[:, :i] + u * ys[:, 1:i + 1]
+    result = np.empty((len(u) + 2, 2), np.int32)
+    result[0] = p_list[0]
+    result[1:-1, 0] = np.round(xs[:, 0])
+    result[1:-1, 1] = np.round(ys[:, 0])
+    result[-1] = p_list[-1]
+    return result
+
+
+@functools.lru_cache(maxsize=None)
+def _bezier_params():
+    """与cg_algorithms.bezier_curve相同的参数序列（u从0.001开始逐次累加0.001）"""
+    params = []
+    u = 0.001
+    while u < 1:
+        params.append(u)
+        u += 0.001
+    return np.array(params)
+
+
+def bspline_curve(p_list):
+    """三次均匀B样条曲线，使用预先计算并在各区间、各曲线间共用的基函数权值，结果与cg_algorithms.bspline_curve逐点一致"""
+    n = len(p_list)
+    if n < 4:
+        return np.zeros((0, 2), np.int32)
+    span, weights = _bspline_weights(n)
+    points = np.asarray(p_list, dtype=np.float64).reshape(-1, 2)
+    # 与原算法相同，按控制点下标升序依次累加四个非零项
+    result = 0.0
+    for t in range(4):
+        result = result + points[span - 3 + t] * weights[:, t, None]
+    return np.round(result).astype(np.int32)
+
+
+def _bspline_weights(n):
+    """参数u从3开始逐次累加1/1000直至n，返回每个采样点所在区间j及该区间上四个非零基函数的值
+
+    不同控制点数的参数序列互为前缀，因此只为目前最长的序列计算一次，较短的曲线取其前缀
+    """
+    global _bspline_cache
+    u, span, weights = _bspline_cache
+    if len(u) == 0 or u[-1] + 1 / 1000 < n:
+        limit = max(n, 2 * int(u[-1]) if len(u) else 0)
+        params = []
+        x = 3
+        while x < limit:
+            params.append(x)
+            x += 1 / 1000
+        u = np.array(params, np.float64)
+        span = u.astype(np.int64)
+        basis = np.zeros((len(u), 5), np.float64)  # basis[:, t]对应N(j-3+t, m)
+        basis[:, 3] = 1
+        for m in range(2, 5):
+            for t in range(4 - m, 4):
+                i = span - 3 + t
+                basis[:, t] = (u - i) / (m - 1) * basis[:, t] + (i + m - u) / (m - 1) * basis[:, t + 1]
+        weights = basis[:, :4]
+        _bspline_cache = (u, span, weights)
+    count = np.searchsorted(u, n)
+    return span[:count], weights[:count]
+
+
+_bspline_cache = (np.zeros(0), np.zeros(0, np.int64), np.zeros((0, 4)))
+
+
+def translate(points, dx, dy):
+    """平移变换，可一次作用于多个图元拼接而成的点集
+
+    :param points: (array-like: (N, 2)) 参数点坐标
+    :param dx: (int) 水平方向平移量
+    :param dy: (int) 垂直方向平移量
+    :return: (numpy.ndarray of int32: (N, 2)) 变换后的坐标
+    """
+    return _as_pixels(np.asarray(points, dtype=np.int64).reshape(-1, 2) + [dx, dy])
+
+
+def rotate(points, x, y, r, unit=True):
+    """旋转变换（除椭圆外），浮点运算顺序与cg_algorithms.rotate相同，取整结果一致
+
+    :param points: (array-like: (N, 2)) 参数点坐标
+    :param x: (int) 旋转中心x坐标
+    :param y: (int) 旋转中心y坐标
+    :param r: (int) 顺时针旋转角度（°）
+    :param unit: (bool) 角度单位
+    :return: (numpy.ndarray of int32: (N, 2)) 变换后的坐标
+    """
+    if unit:
+        r = r / 180 * math.pi
+    cos_r = math.cos(r)
+    sin_r = math.sin(r)
+    points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+    x0, y0 = (points[:, 0] - x).astype(np.float64), (points[:, 1] - y).astype(np.float64)
+    result = np.stack([np.round(x0 * cos_r - y0 * sin_r), np.round(x0 * sin_r + y0 * cos_r)], axis=1)
+    return _as_pixels(result.astype(np.int64) + [x, y])
+
+
+def scale(points, x, y, s):
+    """缩放变换，取整结果与cg_algorithms.scale一致
+
+    :param points: (array-like: (N, 2)) 参数点坐标
+    :param x: (int) 缩放中心x坐标
+    :param y: (int) 缩放中心y坐标
+    :param s: (float) 缩放倍数
+    :return: (numpy.ndarray of int32: (N, 2)) 变换后的坐标
+    """
+    points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+    return _as_pixels(np.round((points - [x, y]) * s).astype(np.int64) + [x, y])
+
+
+def clip_segments(segments, x_min, y_min, x_max, y_max, algorithm):
+    """用同一裁剪窗口批量裁剪线段，结果与逐条调用cg_algorithms.clip一致
+
+    :param segments: (array-like: (N, 2, 2)) N条线段的起点和终点坐标
+    :param x_min: 裁剪窗口左上角x坐标
+    :param y_min: 裁剪窗口左上角y坐标
+    :param x_max: 裁剪窗口右下角x坐标
+    :param y_max: 裁剪窗口右下角y坐标
+    :param algorithm: (string) 使用的裁剪算法，包括'Cohen-Sutherland'和'Liang-Barsky'
+    :return: (tuple: (clipped, accept)) clipped为int32数组(N, 2, 2)，被舍弃的线段为[[0, 0], [0, 0]]；accept为bool数组(N,)
+    """
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 2, 2)
+    n = len(segments)
+    clipped = np.zeros((n, 2, 2), np.int32)
+    accept = np.zeros(n, bool)
+    if x_min == x_max or y_min == y_max or n == 0:
+        return clipped, accept
+    if x_min > x_max:
+        x_min, x_max = x_max, x_min
+    if y_min > y_max:
+        y_min, y_max = y_max, y_min
+    x0, y0 = segments[:, 0, 0].copy(), segments[:, 0, 1].copy()
+    x1, y1 = segments[:, 1, 0].copy(), segments[:, 1, 1].copy()
+    if algorithm == 'Cohen-Sutherland':
+        active = np.arange(n)
+        # 整数窗口下每条线段至多经过4次求交即可确定结果；非整数窗口时求交取整可能使原算法无限循环，此时舍弃该线段
+        for _ in range(8):
+            if len(active) == 0:
+                break
+            code0 = _outcode(x0[active], y0[active], x_min, y_min, x_max, y_max)
+            code1 = _outcode(x1[active], y1[active], x_min, y_min, x_max, y_max)
+            done = (code0 | code1) == 0
+            # 求交时除零（原算法会抛出ZeroDivisionError）得到的非有限坐标按舍弃处理
+            accept[active[done & np.isfinite(x0[active] + y0[active] + x1[active] + y1[active])]] = True
+            keep = ~done & ((code0 & code1) == 0)
+            active, code0, code1 = active[keep], code0[keep], code1[keep]
+            # 起点在窗口内时交换两端点，使被裁剪的总是起点
+            swap = active[code0 == 0]
+            x0[swap], x1[swap] = x1[swap], x0[swap]
+            y0[swap], y1[swap] = y1[swap], y0[swap]
+            code0 = np.where(code0 == 0, code1, code0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                for bit, bound in ((1, x_min), (2, x_max)):
+                    i = active[(code0 & bit) != 0]
+                    y0[i] = np.round(y0[i] + ((bound - x0[i]) * (y0[i] - y1[i]) / (x0[i] - x1[i])))
+                    x0[i] = bound
+                for bit, bound in ((4, y_min), (8, y_max)):
+                    i = active[(code0 & bit) != 0]
+                    x0[i] = np.round(x0[i] + ((bound - y0[i]) * (x0[i] - x1[i]) / (y0[i] - y1[i])))
+                    y0[i] = bound
+        ends = np.trunc(np.stack([x0, y0, x1, y1], axis=1)[accept])
+    elif algorithm == 'Liang-Barsky':
+        p = np.stack([x0 - x1, x1 - x0, y0 - y1, y1 - y0], axis=1)
+        q = np.stack([x0 - x_min, x_max - x0, y0 - y_min, y_max - y0], axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = q / p
+        u0 = np.max(np.where(p < 0, ratio, 0), axis=1, initial=0)
+        u1 = np.min(np.where(p > 0, ratio, 1), axis=1, initial=1)
+        accept = ~((p == 0) & (q < 0)).any(axis=1) & (u0 <= u1)
+        u0, u1 = u0[accept], u1[accept]
+        sx, sy, dx, dy = x0[accept], y0[accept], (x1 - x0)[accept], (y1 - y0)[accept]
+        ends = np.round(np.stack([sx + u0 * dx, sy + u0 * dy, sx + u1 * dx, sy + u1 * dy], axis=1))
+    else:
+        return clipped, accept
+    clipped[accept] = ends.reshape(-1, 2, 2)
+    return clipped, accept
+
+
+def pixel_spans(pixels):
+    """将像素点合并为水平线段：同一行中x坐标连续的像素合并为一段，重复的像素只计一次
+
+    :param pixels: (array-like of int: (N, 2)) 像素点坐标
+    :return: (numpy.ndarray of int32: (M, 3)) 水平线段[y, x_start, x_end]，按y、x_start升序排列，互不重叠
+    """
+    pixels = np.asarray(pixels, dtype=np.int64).reshape(-1, 2)
+    if len(pixels) == 0:
+        return np.zeros((0, 3), np.int32)
+    order = np.lexsort((pixels[:, 0], pixels[:, 1]))
+    x = pixels[order, 0]
+    y = pixels[order, 1]
+    # 行变化或x不连续处开始新的一段，重复的像素（x之差为0）不开始新段
+    first = np.flatnonzero(np.concatenate([[True], (y[1:] != y[:-1]) | (x[1:] - x[:-1] > 1)]))
+    last = np.append(first[1:], len(x)) - 1
+    return np.stack([y[first], x[first], x[last]], axis=1).astype(np.int32)
+
+
+def span_pixels(spans):
+    """将水平线段展开为像素点
+
+    :param spans: (array-like of int: (N, 3)) 水平线段[y, x_start, x_end]
+    :return: (numpy.ndarray of int32: (M, 2)) 像素点坐标，按线段的顺序排列
+    """
+    spans = np.asarray(spans, dtype=np.int64).reshape(-1, 3)
+    lengths = np.maximum(spans[:, 2] - spans[:, 1] + 1, 0)
+    index = np.repeat(np.arange(len(spans)), lengths)
+    starts = np.cumsum(lengths) - lengths
+    x = np.arange(len(index)) - starts[index] + spans[index, 1]
+    return np.stack([x, spans[index, 0]], axis=1).astype(np.int32)
+
+
+def clip_spans(spans, x_min, y_min, x_max, y_max):
+    """将水平线段裁剪到矩形x_min <= x < x_max、y_min <= y < y_max内，去掉裁剪后为空的线段
+
+    :param spans: (array-like of int: (N, 3)) 水平线段[y, x_start, x_end]
+    :return: (numpy.ndarray of int32: (M, 3)) 裁剪后的水平线段
+    """
+    spans = np.asarray(spans, dtype=np.int64).reshape(-1, 3)
+    spans = spans[(spans[:, 0] >= y_min) & (spans[:, 0] < y_max)]
+    x_start = np.maximum(spans[:, 1], x_min)
+    x_end = np.minimum(spans[:, 2], x_max - 1)
+    keep = x_start <= x_end
+    return np.stack([spans[keep, 0], x_start[keep], x_end[keep]], axis=1).astype(np.int32)
+
+
+def write_spans(canvas, spans, value, mask=None):
+    """将水平线段写入画布：较长的线段以切片赋值逐段写入，Python层面的开销与线段数而非像素数成正比；
+    较短的线段展开为像素索引后一次写入
+
+    :param canvas: (numpy.ndarray) 画布，前两维为行、列
+    :param spans: (numpy.ndarray: (N, 3)) 画布范围内的水平线段
+    :param value: 写入的值，如颜色
+    :param mask: (numpy.ndarray of bool) 不为None时只写入mask为True的像素
+    """
+    long = spans[:, 2] - spans[:, 1] + 1 >= _SLICE_MIN_LENGTH
+    for y, x_start, x_end in spans[long].tolist():
+        if mask is None:
+            canvas[y, x_start:x_end + 1] = value
+        else:
+            row = canvas[y, x_start:x_end + 1]
+            row[mask[y, x_start:x_end + 1]] = value
+    pixels = span_pixels(spans[~long])
+    rows, cols = pixels[:, 1], pixels[:, 0]
+    if mask is not None:
+        hit = mask[rows, cols]
+        rows, cols = rows[hit], cols[hit]
+    canvas[rows, cols] = value
+
+
+def _outcode(x, y, x_min, y_min, x_max, y_max):
+    return (x < x_min) * 1 | (x > x_max) * 2 | (y < y_min) * 4 | (y > y_max) * 8
+
+
+def _accumulate(out, start, delta, lengths, offsets):
+    """逐条线段按顺序累加浮点增量（与原算法的y_k += delta_y逐次相加保持相同的舍入误差）"""
+    order = np.argsort(lengths, kind='stable')
+    for i in range(0, len(order), _CHUNK_SIZE):
+        rows = order[i:i + _CHUNK_SIZE]
+        width = int(lengths[rows].max())
+        acc = np.empty((len(rows), width), np.float64)
+        acc[:, 0] = start[rows]
+        acc[:, 1:] = delta[rows, None]
+        np.add.accumulate(acc, axis=1, out=acc)
+        col = np.arange(width)
+        mask = col[None, :] < lengths[rows, None]
+        out[(offsets[rows, None] + col[None, :])[mask]] = acc[mask]
+
+
+def _as_pixels(pixels):
+    return np.asarray(pixels, dtype=np.int32).reshape(-1, 2)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+import argparse
+import fnmatch
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import cg_algorithms as alg
+
+# 基准测试：按参数生成工作负载，分别计时cg_algorithms中的各算法与cg_cli.py的端到端运行，结果写入JSON；
+# 给定基准结果时，任一用例变慢超过阈值即以非零状态退出。所有工作负载由固定的随机种子生成，两次运行之间可比
+
+LINE_LENGTHS = (10, 100, 1000)
+CONTROL_POINTS = (4, 8, 16, 32)
+ELLIPSE_RADII = (10, 100, 500)
+CLIP_HIT_RATIOS = (0.0, 0.5, 1.0)
+CANVAS_SIZES = (200, 600, 1000)
+
+
+def random_lines(rng, count, length):
+    """生成count条长度约为length的线段"""
+    lines = []
+    for _ in range(count):
+        angle = rng.uniform(0, 2 * math.pi)
+        x0, y0 = rng.randint(0, 1000), rng.randint(0, 1000)
+        lines.append([[x0, y0], [x0 + round(length * math.cos(angle)), y0 + round(length * math.sin(angle))]])
+    return lines
+
+
+def random_segments(rng, count, hit_ratio, window):
+    """生成count条线段，其中约hit_ratio比例与裁剪窗口相交，其余完全在窗口左上方
+
+    Cohen-Sutherland算法在求交后线段退化为水平或竖直时可能除零，这样的线段被重新生成
+    """
+    x_min, y_min, x_max, y_max = window
+    segments = []
+    while len(segments) < count:
+        if rng.random() < hit_ratio:
+            p0 = [rng.randint(x_min, x_max), rng.randint(y_min, y_max)]
+            p1 = [rng.randint(x_min - 200, x_max + 200), rng.randint(y_min - 200, y_max + 200)]
+        else:
+            p0 = [rng.randint(x_min - 200, x_min - 1), rng.randint(y_min - 200, y_min - 1)]
+            p1 = [rng.randint(x_min - 200, x_min - 1), rng.randint(y_min - 200, y_min - 1)]
+        try:
+            alg.clip([p0, p1], x_min, y_min, x_max, y_max, 'Cohen-Sutherland')
+        except ZeroDivisionError:
+            continue
+        segments.append([p0, p1])
+    return segments
+
+
+def random_script(rng, size, count):
+    """生成在size x size画布上绘制count个随机图元并保存画布的命令脚本"""
+    def point():
+        return '%d %d' % (rng.randint(0, size - 1), rng.randint(0, size - 1))
+
+    lines = ['resetCanvas %d %d' % (size, size)]
+    for i in range(count):
+        lines.append('setColor %d %d %d' % (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)))
+        kind = i % 4
+        if kind == 0:
+            lines.append('drawLine line%d %s %s %s' % (i, point(), point(), rng.choice(['DDA', 'Bresenham'])))
+        elif kind == 1:
+            lines.append('drawPolygon polygon%d %s %s %s %s' % (i, point(), point(), point(),
+                                                                rng.choice(['DDA', 'Bresenham'])))
+        elif kind == 2:
+            lines.append('drawEllipse ellipse%d %s %s' % (i, point(), point()))
+        else:
+            lines.append('drawCurve curve%d %s %s %s %s %s' % (i, point(), point(), point(), point(),
+                                                             rng.choice(['Bezier', 'B-spline'])))
+        if i % 10 == 9:
+            lines.append('translate line%d 3 -2' % (i - i % 4))
+            lines.append('rotate polygon%d %d %d 30' % (i - i % 4 + 1, size // 2, size // 2))
+    lines.append('saveCanvas bench')
+    return '\n'.join(lines) + '\n'
+
+
+def make_cases(scale):
+    """
+    :param scale: (float) 工作负载规模的倍数
+    :return: (list of tuple: (name, params, function)) 基准用例，function无参数，每次调用执行一次完整的工作负载
+    """
+    rng = random.Random(0)
+    n = max(1, int(100 * scale))
+    cases = []
+    for length in LINE_LENGTHS:
+        lines = random_lines(rng, n, length)
+        for algorithm in ('Naive', 'DDA', 'Bresenham'):
+            cases.append(('draw_line/%s/length=%d' % (algorithm, length), {'count': n, 'length': length},
+                          lambda lines=lines, algorithm=algorithm: [alg.draw_line(p, algorithm) for p in lines]))
+    for count in CONTROL_POINTS:
+        curves = [[[rng.randint(0, 1000), rng.randint(0, 1000)] for _ in range(count)] for _ in range(max(1, n // 10))]
+        for algorithm in ('Bezier', 'B-spline'):
+            cases.append(('draw_curve/%s/points=%d' % (algorithm, count), {'count': len(curves), 'points': count},
+                          lambda curves=curves, algorithm=algorithm: [alg.draw_curve(p, algorithm) for p in curves]))
+    for radius in ELLIPSE_RADII:
+        boxes = []
+        for _ in range(max(1, n // 10)):
+            x, y = rng.randint(0, 1000), rng.randint(0, 1000)
+            boxes.append([[x - radius, y - radius // 2], [x + radius, y + radius // 2]])
+        cases.append(('draw_ellipse/radius=%d' % radius, {'count': len(boxes), 'radius': radius},
+                      lambda boxes=boxes: [alg.draw_ellipse(p) for p in boxes]))
+    window = (300, 300, 700, 700)
+    for hit_ratio in CLIP_HIT_RATIOS:
+        segments = random_segments(rng, n * 10, hit_ratio, window)
+        for algorithm in ('Cohen-Sutherland', 'Liang-Barsky'):
+            cases.append(('clip/%s/hit=%.1f' % (algorithm, hit_ratio), {'count': len(segments), 'hit_ratio': hit_ratio},
+                          lambda segments=segments, algorithm=algorithm: [alg.clip(p, *window, algorithm)
+                                                                          for p in segments]))
+    return cases
+
+
+def make_cli_cases(scale, cli_args, workdir):
+    """端到端用例：以子进程运行cg_cli.py，计时包含解释器启动与BMP写入"""
+    rng = random.Random(1)
+    cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cg_cli.py')
+    cases = []
+    for size in CANVAS_SIZES:
+        count = max(4, int(size * scale / 10))
+        script = os.path.join(workdir, 'canvas%d.txt' % size)
+        with open(script, 'w') as fp:
+            fp.write(random_script(rng, size, count))
+        output_dir = os.path.join(workdir, 'out%d' % size)
+        command = [sys.executable, cli, script, output_dir] + cli_args
+        cases.append(('cg_cli/canvas=%d' % size, {'size': size, 'items': count, 'args': cli_args},
+                      lambda command=command: subprocess.run(command, check=True)))
+    return cases
+
+
+def measure(function, repeat, min_time=0.05):
+    """计时：先确定每次计时中连续调用的次数number，使一次计时不短于min_time，再计时repeat次
+
+    :return: (tuple: (best, mean, number)) 单次调用的最短与平均耗时（秒）及每次计时的调用次数
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+    times = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number)
+    return min(times), sum(times) / len(times), number
+
+
+def compare(results, baseline, threshold):
+    """与基准结果比较最短耗时
+
+    :param results: (dict: name -> result) 本次结果
+    :param baseline: (dict: name -> result) 基准结果
+    :param threshold: (float) 允许变慢的比例，如0.1表示最多慢10%
+    :return: (list of tuple: (name, ratio)) 变慢超过阈值的用例及本次与基准耗时之比
+    """
+    regressions = []
+    for name, result in results.items():
+        if name in baseline and baseline[name]['best'] > 0:
+            ratio = result['best'] / baseline[name]['best']
+            result['ratio'] = ratio
+            if ratio > 1 + threshold:
+                regressions.append((name, ratio))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='cg_algorithms与cg_cli.py的基准测试')
+    parser.add_argument('-o', '--output', default='bench.json', help='结果JSON文件')
+    parser.add_argument('--baseline', help='基准结果JSON文件，给定时与之比较')
+    parser.add_argument('--threshold', type=float, default=0.2, help='允许变慢的比例，超过即失败（默认0.2即20%%）')
+    parser.add_argument('--repeat', type=int, default=5, help='每个用例运行的次数，取最短耗时')
+    parser.add_argument('--min-time', type=float, default=0.05, help='每次计时的最短时间（秒），工作负载很小时连续运行多次')
+    parser.add_argument('--scale', type=float, default=1.0, help='工作负载规模的倍数')
+    parser.add_argument('--filter', default='*', help='只运行名称与该通配符模式匹配的用例')
+    parser.add_argument('--no-cli', action='store_true', help='不运行cg_cli.py端到端用例')
+    parser.add_argument('--cli-args', default='', help='传给cg_cli.py的额外参数，如"--backend numpy"')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        cases = make_cases(args.scale)
+        if not args.no_cli:
+            cases += make_cli_cases(args.scale, args.cli_args.split(), workdir)
+        results = {}
+        for name, params, function in cases:
+            if not fnmatch.fnmatchcase(name, args.filter):
+                continue
+            best, mean, number = measure(function, args.repeat, args.min_time)
+            results[name] = {'params': params, 'best': best, 'mean': mean, 'repeat': args.repeat, 'number': number}
+            print('%-40s %10.4f s' % (name, best))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)['results']
+        regressions = compare(results, baseline, args.threshold)
+    with open(args.output, 'w') as fp:
+        json.dump({
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'scale': args.scale,
+            'results': results,
+        }, fp, indent=2)
+    for name, ratio in regressions:
+        print('regression: %s is %.2fx the baseline' % (name, ratio), file=sys.stderr)
+    if regressions:
+        sys.exit(1)
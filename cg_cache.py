@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+import threading
+from collections import OrderedDict
+
+import cg_algorithms as alg
+
+
+def rasterize(item_type, p_list, algorithm, adaptive=False):
+    """按图元类型调用cg_algorithms中的绘制算法
+
+    :param item_type: (string) 图元类型，'line'、'polygon'、'ellipse'、'curve'
+    :param p_list: (list of list of int) 图元参数
+    :param algorithm: (string) 绘制算法
+    :param adaptive: (bool) 曲线是否自适应采样
+    :return: (list of list of int) 绘制结果的像素点坐标列表，is_spans为True的图元为水平线段列表
+    """
+    if item_type == 'line':
+        return alg.draw_line(p_list, algorithm)
+    elif item_type == 'polygon' and algorithm == 'Fill':
+        return alg.fill_polygon(p_list)
+    elif item_type == 'polygon':
+        return alg.draw_polygon(p_list, algorithm)
+    elif item_type == 'ellipse':
+        return alg.draw_ellipse(p_list)
+    elif item_type == 'curve':
+        return alg.draw_curve(p_list, algorithm, adaptive)
+    return []
+
+
+def is_spans(item_type, algorithm, raster_format='pixels'):
+    """图元的光栅化结果是否为水平线段[[y, x_start, x_end], ...]，否则为像素点坐标
+
+    :param raster_format: (string) 光栅化结果的格式，'pixels'时只有填充多边形为水平线段，'spans'时全部图元为水平线段
+    """
+    return raster_format == 'spans' or (item_type == 'polygon' and algorithm == 'Fill')
+
+
+def pixel_count(item_type, algorithm, pixels, raster_format='pixels'):
+    """光栅化结果包含的像素数"""
+    if not is_spans(item_type, algorithm, raster_format):
+        return len(pixels)
+    if hasattr(pixels, 'shape'):
+        return int((pixels[:, 2] - pixels[:, 1] + 1).sum())
+    return sum(x_end - x_start + 1 for _, x_start, x_end in pixels)
+
+
+class RasterCache:
+    """
+    光栅化结果的LRU缓存，以(item_type, tuple(p_list), algorithm)为键，GUI与CLI共用
+
+    缓存的像素点结果为共享对象，调用者不得修改；可在多个线程中同时使用，光栅化本身在锁外进行
+    """
+
+    def __init__(self, maxsize=4096, rasterizer=rasterize):
+        """
+
+        :param maxsize: (int) 最多缓存的图元数，为0时不缓存
+        :param rasterizer: (callable: (item_type, p_list, algorithm) -> pixels) 缓存未命中时调用的光栅化函数
+        """
+        self.maxsize = maxsize
+        self.rasterizer = rasterizer
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, item_type, p_list, algorithm):
+        key = (item_type, tuple(tuple(p) for p in p_list), algorithm)
+        with self._lock:
+            pixels = self._entries.get(key)
+            if pixels is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return pixels
+            self.misses += 1
+        pixels = self.rasterizer(item_type, p_list, algorithm)
+        if self.maxsize > 0:
+            with self._lock:
+                self._entries[key] = pixels
+                if len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return pixels
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,130 +1,767 @@
 #!/usr/bin/env python
 # -*- coding:utf-8 -*-
 
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import fnmatch
+import functools
 import os
 import sys
+import time
+from multiprocessing import shared_memory
 
 import numpy as np
 from PIL import Image
 
 import cg_algorithms as alg
+import cg_array as arr
+import cg_cache
+import cg_profile
+import cg_scene
+import cg_store
+import cg_transform
+
+
+def rasterize(item_type, p_list, algorithm, backend='python', curve_sampling='fixed', raster_format='pixels'):
+    """光栅化单个图元
+
+    :param item_type: (string) 图元类型，'line'、'polygon'、'ellipse'、'curve'
+    :param p_list: (list of list of int) 图元参数
+    :param algorithm: (string) 绘制算法
+    :param backend: (string) 光栅化后端，'python'或'numpy'
+    :param curve_sampling: (string) 曲线采样方式，'fixed'或'adaptive'
+    :param raster_format: (string) 结果的格式，'pixels'为像素点坐标（填充多边形为水平线段列表），
+        'spans'为水平线段数组numpy.ndarray of int32: (N, 3)
+    :return: (list of list of int 或 numpy.ndarray) 绘制结果
+    """
+    adaptive = curve_sampling == 'adaptive'
+    if cg_cache.is_spans(item_type, algorithm):
+        spans = cg_cache.rasterize(item_type, p_list, algorithm)
+        if raster_format != 'spans':
+            return spans
+        pixels = np.asarray(spans, dtype=np.int32).reshape(-1, 3)
+    elif backend == 'numpy' and item_type == 'line':
+        pixels = arr.draw_line(p_list, algorithm)
+    elif backend == 'numpy' and item_type == 'polygon':
+        pixels = arr.draw_polygon(p_list, algorithm)
+    elif backend == 'numpy' and item_type == 'ellipse':
+        pixels = arr.draw_ellipse(p_list)
+    elif backend == 'numpy' and item_type == 'curve' and not adaptive:
+        pixels = arr.draw_curve(p_list, algorithm)
+    else:
+        pixels = cg_cache.rasterize(item_type, p_list, algorithm, adaptive)
+        if raster_format != 'spans':
+            return pixels
+    if raster_format == 'spans' and not cg_cache.is_spans(item_type, algorithm):
+        pixels = arr.pixel_spans(pixels)  # 只保留紧凑的水平线段，逐像素的结果随即释放
+    pixels.flags.writeable = False  # 结果会被缓存共享
+    return pixels
+
+
+def to_index(pixels, width, height):
+    """将像素点坐标转为画布的行、列索引数组，超出画布范围的点被裁掉（不会越界或因负索引绕回）
+
+    :param pixels: (list of list of int 或 numpy.ndarray) 像素点坐标
+    :return: (tuple of numpy.ndarray: (rows, cols)) 画布索引
+    """
+    pixels = np.asarray(pixels, dtype=np.int64).reshape(-1, 2)
+    x, y = pixels[:, 0], pixels[:, 1]
+    inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+    return y[inside], x[inside]  # 根据Pillow版本而定，最终输出的视觉结果需要以画布左上角为坐标原点
+
+
+class CanvasRenderer:
+    """
+    在多次saveCanvas之间保留的画布，按图元增量更新
+
+    每个图元的像素索引在光栅化后缓存，只有被标记为脏（或新加入）的图元才会重新光栅化；
+    脏图元新旧像素覆盖的区域先恢复为白色，再按插入顺序重绘与该区域相交的图元，保持原有的覆盖关系。
+    结果为水平线段的图元（填充多边形，或raster_format为'spans'时的全部图元）保存为线段，以切片赋值写入
+    """
+
+    def __init__(self, width, height, cache=None, raster_format='pixels'):
+        """
+
+        :param cache: (cg_cache.RasterCache) 光栅化结果缓存，可在多个画布之间共用
+        :param raster_format: (string) cache中光栅化结果的格式，见rasterize
+        """
+        self.width = width
+        self.height = height
+        self.raster_format = raster_format
+        if cache is None:
+            cache = cg_cache.RasterCache(rasterizer=functools.partial(rasterize, raster_format=raster_format))
+        self.cache = cache
+        self.canvas = np.zeros([height, width, 3], np.uint8)
+        self.canvas.fill(255)
+        # item_id -> (rows, cols, bbox, spans)，bbox为(row_min, row_max, col_min, col_max)或None；
+        # 结果为水平线段的图元rows、cols为None，spans为画布范围内的水平线段，其余图元的spans为None
+        self.pixels = {}
+        self.dirty = set()
+
+    def invalidate(self, item_id):
+        """标记图元的参数、颜色或算法已改变，下次render时重新光栅化"""
+        self.dirty.add(item_id)
+
+    def render(self, store):
+        """
+        :param store: (cg_store.ItemStore) 图元
+        :return: (numpy.ndarray of uint8: (height, width, 3)) 画布
+        """
+        keys = store.keys()
+        stale = (self.dirty | self.pixels.keys()) - keys
+        dirty = (self.dirty | (keys - self.pixels.keys())) & keys
+        self.dirty = set()
+        if not stale and not dirty:
+            return self.canvas
+
+        mask = np.zeros([self.height, self.width], bool)
+        for item_id in stale | dirty:
+            if item_id in self.pixels:
+                rows, cols, _, spans = self.pixels.pop(item_id)
+                if spans is None:
+                    mask[rows, cols] = True
+                else:
+                    arr.write_spans(mask, spans, True)
+        for item_id in dirty:
+            item_type, p_list, algorithm, _ = store.item(item_id)
+            pixels = self.cache.get(item_type, p_list, algorithm)
+            if cg_cache.is_spans(item_type, algorithm, self.raster_format):
+                spans = arr.clip_spans(pixels, 0, 0, self.width, self.height)
+                bbox = None
+                if len(spans):
+                    bbox = (spans[:, 0].min(), spans[:, 0].max(), spans[:, 1].min(), spans[:, 2].max())
+                self.pixels[item_id] = (None, None, bbox, spans)
+                arr.write_spans(mask, spans, True)
+                continue
+            rows, cols = to_index(pixels, self.width, self.height)
+            bbox = (rows.min(), rows.max(), cols.min(), cols.max()) if len(rows) else None
+            self.pixels[item_id] = (rows, cols, bbox, None)
+            mask[rows, cols] = True
+
+        mask_rows = np.flatnonzero(mask.any(axis=1))
+        if len(mask_rows) == 0:
+            return self.canvas
+        mask_cols = np.flatnonzero(mask.any(axis=0))
+        r0, r1, c0, c1 = mask_rows[0], mask_rows[-1], mask_cols[0], mask_cols[-1]
+        self.canvas[mask] = 255
+        # 相邻同色图元合并为一次写入：像素索引、脏图元的水平线段与只写入mask内的水平线段各拼接后写入
+        runs = []
+        for slot, (item_id, color) in enumerate(zip(store.ids, store.packed_colors().tolist())):
+            rows, cols, bbox, spans = self.pixels[item_id]
+            if bbox is None or bbox[0] > r1 or bbox[1] < r0 or bbox[2] > c1 or bbox[3] < c0:
+                continue
+            if not runs or color != runs[-1][0]:
+                runs.append((color, slot, [], [], []))
+            if spans is not None:
+                if item_id in dirty:
+                    runs[-1][3].append(spans)
+                else:
+                    runs[-1][4].append(spans[(spans[:, 0] >= r0) & (spans[:, 0] <= r1)])
+                continue
+            if item_id not in dirty:
+                hit = mask[rows, cols]
+                rows, cols = rows[hit], cols[hit]
+            runs[-1][2].append((rows, cols))
+        for _, slot, indices, spans, masked_spans in runs:
+            color = store.colors[slot]
+            if indices:
+                self.canvas[np.concatenate([i[0] for i in indices]), np.concatenate([i[1] for i in indices])] = color
+            if spans:
+                arr.write_spans(self.canvas, np.concatenate(spans), color)
+            if masked_spans:
+                arr.write_spans(self.canvas, np.concatenate(masked_spans), color, mask)
+        return self.canvas
+
+
+class TiledRenderer:
+    """
+    将画布划分为若干矩形块，由进程池并行绘制，适用于很大的画布
+
+    图元按参数点的包围盒分配到与之相交的块中，各块按插入顺序绘制分配到的图元（只写入块内的像素），
+    因此覆盖关系与整体绘制相同；画布位于共享内存中，各进程直接写入互不重叠的块
+    """
+
+    def __init__(self, width, height, pool, jobs, tile_size=1024):
+        """
+
+        :param pool: (concurrent.futures.ProcessPoolExecutor) 以_init_worker初始化的进程池
+        :param jobs: (int) 进程池的进程数
+        :param tile_size: (int) 块的边长（像素）
+        """
+        self.width = width
+        self.height = height
+        self.pool = pool
+        self.jobs = jobs
+        self.tile_size = tile_size
+        self.shm = None
+        self.canvas = None
+
+    def invalidate(self, item_id):
+        pass  # 每次render都重新绘制全部块
+
+    def render(self, store):
+        """
+        :param store: (cg_store.ItemStore) 图元
+        :return: (numpy.ndarray of uint8: (height, width, 3)) 画布，在下一次render或close之前有效
+        """
+        self.close()
+        if self.width * self.height == 0:
+            self.canvas = np.zeros([self.height, self.width, 3], np.uint8)
+            return self.canvas
+        self.shm = shared_memory.SharedMemory(create=True, size=self.height * self.width * 3)
+        self.canvas = np.ndarray((self.height, self.width, 3), np.uint8, buffer=self.shm.buf)
+        self.canvas.fill(255)
+
+        size = self.tile_size
+        rows = (self.height + size - 1) // size
+        cols = (self.width + size - 1) // size
+        bins = [[] for _ in range(rows * cols)]
+        points, offsets = store.gather()
+        nonempty = np.flatnonzero(np.diff(offsets))
+        low = high = np.zeros((0, 2), np.int64)
+        if len(nonempty):
+            # 各类图元的像素都在参数点的包围盒内，向外扩展1个像素以容纳取整误差
+            low = np.maximum((np.minimum.reduceat(points, offsets[nonempty]).astype(np.int64) - 1) // size, 0)
+            high = np.minimum((np.maximum.reduceat(points, offsets[nonempty]).astype(np.int64) + 1) // size,
+                              [cols - 1, rows - 1])
+        for index, (tx0, ty0), (tx1, ty1) in zip(nonempty.tolist(), low.tolist(), high.tolist()):
+            for ty in range(ty0, ty1 + 1):
+                for tx in range(tx0, tx1 + 1):
+                    bins[ty * cols + tx].append(index)
+
+        # 相邻的块分到同一任务，跨越多个块的图元在同一进程内只光栅化一次
+        tiles = [(ty * size, min((ty + 1) * size, self.height), tx * size, min((tx + 1) * size, self.width),
+                  bins[ty * cols + tx]) for ty in range(rows) for tx in range(cols) if bins[ty * cols + tx]]
+        task_count = min(len(tiles), 4 * self.jobs)
+        futures = []
+        for k in range(task_count):
+            task = tiles[k * len(tiles) // task_count:(k + 1) * len(tiles) // task_count]
+            needed = sorted({index for tile in task for index in tile[4]})
+            futures.append(self.pool.submit(_render_tiles, self.shm.name, self.height, self.width, task,
+                                            {index: store.item(store.ids[index]) for index in needed}))
+        for future in futures:
+            future.result()
+        return self.canvas
+
+    def close(self):
+        """释放共享内存中的画布"""
+        if self.shm is not None:
+            self.canvas = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+def _render_tiles(shm_name, height, width, tiles, items):
+    """在子进程中依次绘制若干块，tiles中每项为(row_start, row_end, col_start, col_end, 图元下标列表)"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        canvas = np.ndarray((height, width, 3), np.uint8, buffer=shm.buf)
+        cache = _worker_options['raster_cache']
+        indices = {}
+        for r0, r1, c0, c1, item_indices in tiles:
+            for index in item_indices:
+                item_type, p_list, algorithm, color = items[index]
+                if cg_cache.is_spans(item_type, algorithm, _worker_options['raster_format']):
+                    spans = arr.clip_spans(cache.get(item_type, p_list, algorithm), c0, r0, c1, r1)
+                    arr.write_spans(canvas, spans, color)
+                    continue
+                if index not in indices:
+                    indices[index] = to_index(cache.get(item_type, p_list, algorithm), width, height)
+                rows, cols = indices[index]
+                inside = (rows >= r0) & (rows < r1) & (cols >= c0) & (cols < c1)
+                canvas[rows[inside], cols[inside]] = color
+        del canvas
+    finally:
+        shm.close()
+
+
+def iter_commands(fp, chunk_size=1 << 20):
+    """按块读取脚本并逐行切分，适用于普通文件、标准输入与管道
+
+    :param fp: (file) 以文本模式打开的脚本
+    :param chunk_size: (int) 每次读取的字符数
+    :return: (generator of tuple: (line_no, tokens)) 行号（从1开始）与该行以空白分隔的各项，跳过空行
+    """
+    line_no = 0
+    rest = ''
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            break
+        lines = (rest + chunk).split('\n')
+        rest = lines.pop()
+        for line in lines:
+            line_no += 1
+            tokens = line.split()
+            if tokens:
+                yield line_no, tokens
+    if rest.strip():
+        yield line_no + 1, rest.split()
+
+
+def parse_points(tokens):
+    """将坐标序列['x0', 'y0', 'x1', 'y1', ...]成批转换为[[x0, y0], [x1, y1], ...]"""
+    values = list(map(int, tokens))
+    return [list(p) for p in zip(values[0::2], values[1::2])]
+
+
+class ScriptError(Exception):
+    """脚本命令执行失败，消息中包含该命令在脚本中的行号"""
+
+
+class ScriptRunner:
+    """
+    命令脚本解释器，按命令名通过分派表调用对应的处理函数
+    """
+
+    def __init__(self, output_dir, raster_cache=None, deferred_transform=False, tile_pool=None, tile_jobs=0,
+                 tile_size=1024, profiler=None, raster_format='pixels'):
+        """
+
+        :param output_dir: (string) 保存画布的目录
+        :param raster_cache: (cg_cache.RasterCache) 光栅化结果缓存，在多个画布之间共用
+        :param deferred_transform: (bool) 是否将变换复合为矩阵并推迟到光栅化前取整
+        :param tile_pool: (concurrent.futures.ProcessPoolExecutor) 不为None时以TiledRenderer分块并行绘制画布
+        :param tile_jobs: (int) tile_pool的进程数
+        :param tile_size: (int) 分块的边长（像素）
+        :param profiler: (cg_profile.Profiler) 不为None时记录每条命令及saveCanvas各阶段的耗时，
+            光栅化的耗时与像素数需要raster_cache的光栅化函数由同一profiler包装
+        :param raster_format: (string) raster_cache中光栅化结果的格式，见rasterize
+        """
+        self.output_dir = output_dir
+        self.raster_cache = raster_cache
+        self.deferred_transform = deferred_transform
+        self.tile_pool = tile_pool
+        self.tile_jobs = tile_jobs
+        self.tile_size = tile_size
+        self.profiler = profiler
+        self.raster_format = raster_format
+        self.store = cg_store.ItemStore()
+        self.groups = {}  # 组名 -> 图元ID列表
+        self.pen_color = np.zeros(3, np.uint8)
+        self.width = 0
+        self.height = 0
+        self.renderer = self.make_renderer()
+        self.deferred = cg_transform.DeferredTransforms() if deferred_transform else None
+        self.command_count = 0
+        self.handlers = {
+            'resetCanvas': self.reset_canvas,
+            'saveCanvas': self.save_canvas,
+            'saveScene': self.save_scene,
+            'loadScene': self.load_scene,
+            'setColor': self.set_color,
+            'group': self.group,
+            'drawLine': self.draw_line,
+            'drawPolygon': self.draw_polygon,
+            'fillPolygon': self.fill_polygon,
+            'drawEllipse': self.draw_ellipse,
+            'drawCurve': self.draw_curve,
+            'translate': self.translate,
+            'rotate': self.rotate,
+            'scale': self.scale,
+            'clip': self.clip,
+        }
+
+    def make_renderer(self):
+        if self.tile_pool is not None:
+            return TiledRenderer(self.width, self.height, self.tile_pool, self.tile_jobs, self.tile_size)
+        return CanvasRenderer(self.width, self.height, self.raster_cache, self.raster_format)
+
+    def close(self):
+        if isinstance(self.renderer, TiledRenderer):
+            self.renderer.close()
+
+    def run(self, fp):
+        """执行脚本中的全部命令"""
+        commands = iter_commands(fp)
+        if self.profiler is not None:
+            commands = self.profiler.timed_commands(commands)
+        self.execute(commands)
+
+    def execute(self, commands):
+        """依次执行命令，未知命令被忽略
+
+        :param commands: (iterable of tuple: (line_no, tokens)) 命令
+        """
+        if self.profiler is not None:
+            self.execute_profiled(commands)
+            return
+        handlers = self.handlers
+        for line_no, tokens in commands:
+            handler = handlers.get(tokens[0])
+            if handler is not None:
+                try:
+                    handler(tokens)
+                except Exception as e:
+                    raise ScriptError('line %d: %s: %s: %s' % (line_no, tokens[0], type(e).__name__, e)) from e
+                self.command_count += 1
+
+    def execute_profiled(self, commands):
+        """与execute相同，同时记录每条命令的耗时及其光栅化产生的像素数"""
+        handlers = self.handlers
+        profiler = self.profiler
+        for line_no, tokens in commands:
+            handler = handlers.get(tokens[0])
+            if handler is not None:
+                pixels = profiler.pixels
+                start = time.perf_counter()
+                try:
+                    handler(tokens)
+                except Exception as e:
+                    raise ScriptError('line %d: %s: %s: %s' % (line_no, tokens[0], type(e).__name__, e)) from e
+                profiler.add('command', tokens[0], start, time.perf_counter(), profiler.pixels - pixels,
+                             {'line': line_no})
+                self.command_count += 1
+
+    def phase(self, name):
+        """命令内部的一个阶段，启用profiler时记录其耗时"""
+        return self.profiler.phase(name) if self.profiler is not None else contextlib.nullcontext()
+
+    def add_item(self, item_id, item_type, pointSet, algorithm):
+        self.store.add(item_id, item_type, pointSet, algorithm, self.pen_color)
+        self.renderer.invalidate(item_id)
+        if self.deferred is not None:
+            self.deferred.discard(item_id)
+
+    def targets(self, name):
+        """解析命令中的图元：@组名为组内的图元，含通配符（*、?、[）时为ID与之匹配的全部图元，否则为单个图元
+
+        :param name: (string) 命令中的图元ID、@组名或通配符模式
+        :return: (list) 图元ID，不重复，通配符匹配的图元按插入顺序排列
+        """
+        if name.startswith('@'):
+            return self.groups[name[1:]]
+        if '*' in name or '?' in name or '[' in name:
+            return [item_id for item_id in self.store if fnmatch.fnmatchcase(item_id, name)]
+        return [name]
+
+    def transform_items(self, item_ids, transform, batch_transform, args, matrix):
+        """对图元施加变换：立即模式下单个图元调用cg_algorithms中的变换函数，多个图元时以cg_array中的对应函数
+        一次作用于全部图元的参数点；推迟模式下对每个图元复合同一个变换矩阵
+
+        :param item_ids: (list) 图元ID，不能重复
+        :param transform: (callable: (p_list, *args) -> p_list) cg_algorithms中的变换函数
+        :param batch_transform: (callable: (points, *args) -> points) cg_array中对应的变换函数
+        :param args: (tuple) 变换参数
+        :param matrix: (numpy.ndarray: (3, 3)) 等价的变换矩阵
+        """
+        if self.deferred is not None:
+            for item_id in item_ids:
+                self.deferred.compose(item_id, self.store.point_array(item_id), matrix)
+            return
+        if len(item_ids) == 1:
+            self.store.set_points(item_ids[0], transform(self.store.p_list(item_ids[0]), *args))
+        else:
+            points, offsets = self.store.gather(item_ids)
+            self.store.scatter(item_ids, batch_transform(points, *args), offsets)
+        for item_id in item_ids:
+            self.renderer.invalidate(item_id)
+
+    def reset_canvas(self, line):
+        self.width = int(line[1])
+        self.height = int(line[2])
+        self.store = cg_store.ItemStore()
+        self.groups = {}
+        self.close()
+        self.renderer = self.make_renderer()
+        if self.deferred is not None:
+            self.deferred = cg_transform.DeferredTransforms()
+
+    def resolve_deferred(self):
+        """推迟模式下将累积的变换作用于图元参数"""
+        if self.deferred is not None:
+            for item_id, pointSet in self.deferred.resolve().items():
+                self.store.set_points(item_id, pointSet)
+                self.renderer.invalidate(item_id)
+
+    def save_canvas(self, line):
+        save_name = line[1]
+        with self.phase('resolve'):
+            self.resolve_deferred()
+        with self.phase('render'):
+            canvas = self.renderer.render(self.store)
+        with self.phase('encode'):
+            Image.fromarray(canvas).save(os.path.join(self.output_dir, save_name + '.bmp'), 'bmp')
+
+    def save_scene(self, line):
+        save_name = line[1]
+        self.resolve_deferred()
+        scene = self.store.to_scene(self.width, self.height)
+        cg_scene.save(os.path.join(self.output_dir, save_name + '.scene'), scene)
+
+    def load_scene(self, line):
+        """以场景文件中的画布与图元替换当前画布，画笔颜色不变"""
+        scene = cg_scene.load(os.path.join(self.output_dir, line[1] + '.scene'))
+        self.reset_canvas(['resetCanvas', scene.width, scene.height])
+        self.store.load_scene(scene)
+
+    def set_color(self, line):
+        self.pen_color[0] = int(line[1])
+        self.pen_color[1] = int(line[2])
+        self.pen_color[2] = int(line[3])
+
+    def group(self, line):
+        """group name member...，成员可以是图元ID、@组名或通配符模式，在定义时展开"""
+        name = line[1]
+        members = [item_id for token in line[2:] for item_id in self.targets(token)]
+        for item_id in members:
+            if item_id not in self.store:
+                raise KeyError(item_id)
+        self.groups[name] = list(dict.fromkeys(members))
+
+    def draw_line(self, line):
+        item_id = line[1]
+        algorithm = line[6]
+        self.add_item(item_id, 'line', parse_points(line[2:6]), algorithm)
+
+    def draw_polygon(self, line):
+        item_id = line[1]
+        algorithm = line[-1]
+        self.add_item(item_id, 'polygon', parse_points(line[2:-1]), algorithm)
+
+    def fill_polygon(self, line):
+        """fillPolygon id x0 y0 x1 y1 ...，与drawPolygon id x0 y0 x1 y1 ... Fill相同"""
+        item_id = line[1]
+        self.add_item(item_id, 'polygon', parse_points(line[2:]), 'Fill')
+
+    def draw_ellipse(self, line):
+        item_id = line[1]
+        self.add_item(item_id, 'ellipse', parse_points(line[2:6]), 'null')
+
+    def draw_curve(self, line):
+        item_id = line[1]
+        algorithm = line[-1]
+        self.add_item(item_id, 'curve', parse_points(line[2:-1]), algorithm)
+
+    def translate(self, line):
+        item_ids = self.targets(line[1])
+        dx = int(line[2])
+        dy = int(line[3])
+        self.transform_items(item_ids, alg.translate, arr.translate, (dx, dy), cg_transform.translation(dx, dy))
+
+    def rotate(self, line):
+        item_ids = self.targets(line[1])
+        x = int(line[2])
+        y = int(line[3])
+        r = int(line[4])
+        self.transform_items(item_ids, alg.rotate, arr.rotate, (x, y, r), cg_transform.rotation(x, y, r))
+
+    def scale(self, line):
+        item_ids = self.targets(line[1])
+        x = int(line[2])
+        y = int(line[3])
+        s = float(line[4])
+        self.transform_items(item_ids, alg.scale, arr.scale, (x, y, s), cg_transform.scaling(x, y, s))
+
+    def clip(self, line):
+        item_ids = self.targets(line[1])
+        x_min = int(line[2])
+        y_min = int(line[3])
+        x_max = int(line[4])
+        y_max = int(line[5])
+        clip_algorithm = line[-1]
+        if self.deferred is not None:
+            # 裁剪作用于取整后的参数，之后的变换以裁剪结果为原始点集
+            for resolved_id, pointSet in self.deferred.resolve(item_ids).items():
+                self.store.set_points(resolved_id, pointSet)
+            for item_id in item_ids:
+                self.deferred.discard(item_id)
+        if len(item_ids) == 1:
+            pointSet = alg.clip(self.store.p_list(item_ids[0]), x_min, y_min, x_max, y_max, clip_algorithm)
+            self.store.set_points(item_ids[0], pointSet)
+        else:
+            # 多个图元时以cg_array.clip_segments一次裁剪全部线段（各图元的前两个参数点）
+            points, offsets = self.store.gather(item_ids)
+            if (np.diff(offsets) < 2).any():
+                raise ValueError('clip needs two points per item')
+            segments = np.stack([points[offsets[:-1]], points[offsets[:-1] + 1]], axis=1)
+            clipped, _ = arr.clip_segments(segments, x_min, y_min, x_max, y_max, clip_algorithm)
+            self.store.scatter(item_ids, clipped.reshape(-1, 2), np.arange(len(item_ids) + 1) * 2)
+        for item_id in item_ids:
+            self.renderer.invalidate(item_id)
+
+
+def make_raster_cache(options, profiler=None):
+    rasterizer = functools.partial(rasterize, backend=options['backend'], curve_sampling=options['curve_sampling'],
+                                   raster_format=options['raster_format'])
+    if profiler is not None:
+        rasterizer = profiler.wrap_rasterizer(rasterizer, options['raster_format'])
+    return cg_cache.RasterCache(options['cache_size'], rasterizer)
+
+
+def make_profiler(options):
+    """按options创建Profiler，未启用时为None"""
+    if not options.get('profile'):
+        return None
+    return cg_profile.Profiler(options['trace'], options['profile_origin'])
+
+
+def split_canvases(commands):
+    """在resetCanvas与loadScene处切分命令流，各段可以独立执行
+
+    段与段之间只有画笔颜色会延续，因此同时给出每段开始时的画笔颜色
+
+    :param commands: (iterable of tuple: (line_no, tokens)) 命令
+    :return: (generator of tuple: (pen_color, commands)) 每段开始时的画笔颜色与该段的命令列表
+    """
+    pen_color = [0, 0, 0]
+    start_color = pen_color
+    segment = []
+    for line_no, tokens in commands:
+        if (tokens[0] == 'resetCanvas' or tokens[0] == 'loadScene') and segment:
+            yield start_color, segment
+            start_color = pen_color
+            segment = []
+        elif tokens[0] == 'setColor':
+            try:
+                pen_color = [int(v) for v in tokens[1:4]]
+            except ValueError:
+                pass  # 错误由执行该段的进程按行号报告
+        segment.append((line_no, tokens))
+    if segment:
+        yield start_color, segment
+
+
+_worker_options = None
+
+
+def _init_worker(options):
+    global _worker_options
+    _worker_options = options
+    _worker_options['profiler'] = make_profiler(options)
+    _worker_options['raster_cache'] = make_raster_cache(options, _worker_options['profiler'])
+
+
+def _render_segment(pen_color, commands):
+    profiler = _worker_options['profiler']
+    runner = ScriptRunner(_worker_options['output_dir'], _worker_options['raster_cache'],
+                          _worker_options['deferred_transform'], profiler=profiler,
+                          raster_format=_worker_options['raster_format'])
+    runner.pen_color[:] = pen_color
+    runner.execute(commands)
+    if profiler is None:
+        return runner.command_count, None
+    data = profiler.export()
+    profiler.reset()
+    return runner.command_count, data
+
+
+def run_parallel(commands, options, jobs, profiler=None):
+    """以多个进程并行执行各画布段，输出与串行执行逐字节相同
+
+    若某段保存的文件名在之前的段中出现过，或该段读取场景文件，先等待之前的段全部完成，以保持与串行执行相同的覆盖顺序
+
+    :param commands: (iterable of tuple: (line_no, tokens)) 命令
+    :param options: (dict) 创建ScriptRunner与光栅化缓存所需的参数
+    :param jobs: (int) 进程数
+    :param profiler: (cg_profile.Profiler) 不为None时汇总各进程记录的耗时，options中需有profile等参数
+    :return: (int) 已执行的命令数
+    """
+    def collect(future):
+        count, data = future.result()
+        if data is not None:
+            profiler.merge(data)
+        return count
+
+    command_count = 0
+    saved = set()
+    pending = collections.deque()
+    with concurrent.futures.ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(options,)) as pool:
+        try:
+            for pen_color, segment in split_canvases(commands):
+                names = {(tokens[0], tokens[1]) for _, tokens in segment
+                         if (tokens[0] == 'saveCanvas' or tokens[0] == 'saveScene') and len(tokens) > 1}
+                loads = any(tokens[0] == 'loadScene' for _, tokens in segment)
+                while pending and (len(pending) >= 2 * jobs or names & saved or loads):
+                    command_count += collect(pending.popleft())
+                saved |= names
+                pending.append(pool.submit(_render_segment, pen_color, segment))
+            while pending:
+                command_count += collect(pending.popleft())
+        except ScriptError:
+            for future in pending:
+                future.cancel()
+            raise
+    return command_count
+
 
 if __name__ == '__main__':
-    input_file = sys.argv[1]
-    output_dir = sys.argv[2]
-    os.makedirs(output_dir, exist_ok=True)
-
-    item_dict = {}
-    pen_color = np.zeros(3, np.uint8)
-    width = 0
-    height = 0
-
-    with open(input_file, 'r') as fp:
-        line = fp.readline()
-        while line:
-            line = line.strip().split(' ')
-            if line[0] == 'resetCanvas':
-                width = int(line[1])
-                height = int(line[2])
-                item_dict = {}
-            elif line[0] == 'saveCanvas':
-                save_name = line[1]
-                canvas = np.zeros([height, width, 3], np.uint8)
-                canvas.fill(255)
-                for item_type, p_list, algorithm, color in item_dict.values():
-                    if item_type == 'line':
-                        pixels = alg.draw_line(p_list, algorithm)
-                        for x, y in pixels:
-                            canvas[y, x] = color  # 根据Pillow版本而定，最终输出的视觉结果需要以画布左上角为坐标原点
-                    elif item_type == 'polygon':
-                        pixels = alg.draw_polygon(p_list, algorithm)
-                        for x, y in pixels:
-                            canvas[y, x] = color
-                    elif item_type == 'ellipse':
-                        pixels = alg.draw_ellipse(p_list)
-                        for x, y in pixels:
-                            canvas[y, x] = color
-                    elif item_type == 'curve':
-                        pixels = alg.draw_curve(p_list, algorithm)
-                        for x, y in pixels:
-                            canvas[y, x] = color
-                Image.fromarray(canvas).save(os.path.join(output_dir, save_name + '.bmp'), 'bmp')
-            elif line[0] == 'setColor':
-                pen_color[0] = int(line[1])
-                pen_color[1] = int(line[2])
-                pen_color[2] = int(line[3])
-            elif line[0] == 'drawLine':
-                item_id = line[1]
-                x0 = int(line[2])
-                y0 = int(line[3])
-                x1 = int(line[4])
-                y1 = int(line[5])
-                algorithm = line[6]
-                item_dict[item_id] = ['line', [[x0, y0], [x1, y1]], algorithm, np.array(pen_color)]
-            elif line[0] == 'drawPolygon':
-                item_id = line[1]
-                pointSet = []
-                for i in range(2, len(line) - 1, 2):
-                    pointSet += [[int(line[i]), int(line[i + 1])]]
-                algorithm = line[-1]
-                item_dict[item_id] = ['polygon', pointSet, algorithm, np.array(pen_color)]
-            elif line[0] == 'drawEllipse':
-                item_id = line[1]
-                x0 = int(line[2])
-                y0 = int(line[3])
-                x1 = int(line[4])
-                y1 = int(line[5])
-                item_dict[item_id] = ['ellipse', [[x0, y0], [x1, y1]], 'null', np.array(pen_color)]
-            elif line[0] == 'drawCurve':
-                item_id = line[1]
-                pointSet = []
-                for i in range(2, len(line) - 1, 2):
-                    pointSet += [[int(line[i]), int(line[i + 1])]]
-                algorithm = line[-1]
-                item_dict[item_id] = ['curve', pointSet, algorithm, np.array(pen_color)]
-            elif line[0] == 'translate':
-                item_id = line[1]
-                dx = int(line[2])
-                dy = int(line[3])
-                item_type = item_dict[item_id][0]
-                pointSet = item_dict[item_id][1]
-                algorithm = item_dict[item_id][2]
-                color = item_dict[item_id][3]
-                pointSet = alg.translate(pointSet, dx, dy)
-                item_dict[item_id] = [item_type, pointSet, algorithm, color]
-            elif line[0] == 'rotate':
-                item_id = line[1]
-                x = int(line[2])
-                y = int(line[3])
-                r = int(line[4])
-                item_type = item_dict[item_id][0]
-                pointSet = item_dict[item_id][1]
-                algorithm = item_dict[item_id][2]
-                color = item_dict[item_id][3]
-                pointSet = alg.rotate(pointSet, x, y, r)
-                item_dict[item_id] = [item_type, pointSet, algorithm, color]
-            elif line[0] == 'scale':
-                item_id = line[1]
-                x = int(line[2])
-                y = int(line[3])
-                s = float(line[4])
-                item_type = item_dict[item_id][0]
-                pointSet = item_dict[item_id][1]
-                algorithm = item_dict[item_id][2]
-                color = item_dict[item_id][3]
-                pointSet = alg.scale(pointSet, x, y, s)
-                item_dict[item_id] = [item_type, pointSet, algorithm, color]
-            elif line[0] == 'clip':
-                item_id = line[1]
-                x_min = int(line[2])
-                y_min = int(line[3])
-                x_max = int(line[4])
-                y_max = int(line[5])
-                clip_algorithm = line[-1]
-                item_type = item_dict[item_id][0]
-                pointSet = item_dict[item_id][1]
-                algorithm = item_dict[item_id][2]
-                color = item_dict[item_id][3]
-                pointSet = alg.clip(pointSet, x_min, y_min, x_max, y_max, clip_algorithm)
-                item_dict[item_id] = [item_type, pointSet, algorithm, color]
-            line = fp.readline()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input_file', help='命令脚本，为-时从标准输入读取')
+    parser.add_argument('output_dir')
+    parser.add_argument('--backend', choices=['python', 'numpy'], default='python',
+                        help='光栅化后端，numpy为cg_array中的向量化实现')
+    parser.add_argument('--curve-sampling', choices=['fixed', 'adaptive'], default='fixed',
+                        help='曲线采样方式，adaptive按曲线尺寸选取采样数并以线段连接相邻采样点')
+    parser.add_argument('--raster-format', choices=['pixels', 'spans'], default='pixels',
+                        help='光栅化结果的表示，spans将每个图元保存为水平线段数组并以切片赋值写入画布，大图元的内存显著减少')
+    parser.add_argument('--cache-size', type=int, default=4096, help='光栅化结果LRU缓存的图元数，0表示不缓存')
+    parser.add_argument('--transform', choices=['immediate', 'deferred'], default='immediate',
+                        help='deferred将平移、旋转、缩放复合为矩阵，只在光栅化前作用于原始参数并取整，避免逐步取整的误差累积')
+    parser.add_argument('--jobs', type=int, default=1, help='并行执行各画布（以resetCanvas分隔）的进程数')
+    parser.add_argument('--tile-jobs', type=int, default=0,
+                        help='以多少个进程分块并行绘制每个画布，适用于很大的画布，0表示不分块（不能与--jobs同时使用）')
+    parser.add_argument('--tile-size', type=int, default=1024, help='分块绘制时块的边长（像素）')
+    parser.add_argument('--stats', action='store_true', help='结束时在标准错误输出已执行的命令数及每秒命令数')
+    parser.add_argument('--profile', action='store_true',
+                        help='结束时在标准错误输出按命令、saveCanvas各阶段、图元类型与算法汇总的耗时与像素数')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='将每条命令与光栅化的耗时写为Chrome trace-event格式的JSON（隐含--profile）')
+    args = parser.parse_args()
+    options = {
+        'output_dir': args.output_dir,
+        'backend': args.backend,
+        'curve_sampling': args.curve_sampling,
+        'cache_size': args.cache_size,
+        'raster_format': args.raster_format,
+        'deferred_transform': args.transform == 'deferred',
+        'profile': args.profile or args.trace is not None,
+        'trace': args.trace is not None,
+    }
+    if args.jobs > 1 and args.tile_jobs > 0:
+        parser.error('--jobs and --tile-jobs cannot be combined')
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    options['profile_origin'] = start
+    profiler = make_profiler(options)
+    fp = sys.stdin if args.input_file == '-' else open(args.input_file, 'r')
+    try:
+        if args.jobs > 1:
+            commands = iter_commands(fp)
+            if profiler is not None:
+                commands = profiler.timed_commands(commands)
+            command_count = run_parallel(commands, options, args.jobs, profiler)
+        elif args.tile_jobs > 0:
+            # 分块绘制时光栅化在子进程中进行，只记录主进程中的命令与阶段耗时
+            with concurrent.futures.ProcessPoolExecutor(args.tile_jobs, initializer=_init_worker,
+                                                        initargs=(dict(options, profile=False),)) as tile_pool:
+                runner = ScriptRunner(args.output_dir, deferred_transform=options['deferred_transform'],
+                                      tile_pool=tile_pool, tile_jobs=args.tile_jobs, tile_size=args.tile_size,
+                                      profiler=profiler)
+                try:
+                    runner.run(fp)
+                finally:
+                    runner.close()
+            command_count = runner.command_count
+        else:
+            runner = ScriptRunner(args.output_dir, make_raster_cache(options, profiler), options['deferred_transform'],
+                                  profiler=profiler, raster_format=args.raster_format)
+            runner.run(fp)
+            command_count = runner.command_count
+    except ScriptError as e:
+        parser.exit(1, 'error: %s\n' % e)
+    finally:
+        if fp is not sys.stdin:
+            fp.close()
+    if args.stats:
+        elapsed = time.perf_counter() - start
+        print('%d commands in %.3f s (%.0f commands/s)' % (
+            command_count, elapsed, command_count / elapsed if elapsed > 0 else 0), file=sys.stderr)
+    if profiler is not None:
+        print(profiler.summary(), file=sys.stderr)
+        if args.trace:
+            profiler.write_trace(args.trace)
@@ -2,10 +2,13 @@
 # -*- coding:utf-8 -*-
 import math
 import sys
+import time
 from typing import Optional
 
-from PyQt5.QtCore import QRectF
-from PyQt5.QtGui import QPainter, QMouseEvent, QColor, QPixmap
+import numpy as np
+from PyQt5 import sip
+from PyQt5.QtCore import QRectF, QPointF, Qt, QTimer, QObject, QRunnable, QThreadPool, pyqtSignal
+from PyQt5.QtGui import QPainter, QMouseEvent, QColor, QPixmap, QImage, QTransform, QPolygonF
 from PyQt5.QtWidgets import (
     QApplication,
     QMainWindow,
@@ -15,10 +18,127 @@ from PyQt5.QtWidgets import (
     QGraphicsItem,
     QListWidget,
     QHBoxLayout,
+    QLabel,
     QWidget,
     QStyleOptionGraphicsItem, QColorDialog, QDialog, QInputDialog, QMessageBox, QFileDialog)
 
 import cg_algorithms as alg
+import cg_array as arr
+import cg_cache
+import cg_profile
+import cg_scene
+import cg_spatial
+
+
+def rasterize_spans(item_type, p_list, algorithm):
+    """光栅化为水平线段数组，缓存中只保留这一紧凑的表示
+
+    :return: (numpy.ndarray of int32: (N, 3)) 水平线段[y, x_start, x_end]，只读
+    """
+    pixels = cg_cache.rasterize(item_type, p_list, algorithm)
+    if cg_cache.is_spans(item_type, algorithm):
+        spans = np.asarray(pixels, dtype=np.int32).reshape(-1, 3)
+    else:
+        spans = arr.pixel_spans(pixels)
+    spans.flags.writeable = False  # 结果会被缓存共享
+    return spans
+
+
+# 重绘统计，在菜单中开启后于状态栏显示帧耗时等，并可导出各图元的开销排名
+frame_profiler = cg_profile.FrameProfiler()
+# 光栅化结果缓存，图元参数未改变时重绘不再重新计算；结果均为水平线段
+raster_cache = cg_cache.RasterCache(rasterizer=frame_profiler.wrap_rasterizer(rasterize_spans, 'spans'))
+
+
+def render_image(item_type, key):
+    """将图元光栅化到透明背景的QImage中，图像只覆盖像素点的包围盒
+
+    :param item_type: (string) 图元类型
+    :param key: (tuple) 图元的(p_list, algorithm, color.rgba())，p_list为tuple of tuple
+    :return: (tuple) (左上角x, 左上角y, QImage)，没有像素点时为None
+    """
+    points, algorithm, rgba = key
+    spans = raster_cache.get(item_type, [list(p) for p in points], algorithm)
+    if len(spans) == 0:
+        return None
+    x0, y0 = int(spans[:, 1].min()), int(spans[:, 0].min())
+    w, h = int(spans[:, 2].max()) - x0 + 1, int(spans[:, 0].max()) - y0 + 1
+    buf = np.zeros((h, w), np.uint32)
+    arr.write_spans(buf, spans - np.array([y0, x0, x0], np.int32), rgba)
+    # QImage不持有buf的内存，copy后与buf脱离
+    image = QImage(buf.data, w, h, w * 4, QImage.Format_ARGB32).copy()
+    return int(x0), int(y0), image
+
+
+def render_item_image(item_id, item_type, key):
+    """render_image，开启重绘统计时记录该图元的光栅化耗时与像素数"""
+    if not frame_profiler.enabled:
+        return render_image(item_type, key)
+    with frame_profiler.raster(item_id, item_type, key[1]):
+        return render_image(item_type, key)
+
+
+class RasterTask(QRunnable):
+    """
+    在线程池中执行的一次光栅化
+    """
+
+    def __init__(self, worker, item, version, key):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.worker = worker
+        self.item = item
+        self.version = version
+        self.key = key
+        self.item_id = item.id
+        self.item_type = item.item_type
+
+    def run(self):
+        self.worker.finished.emit(self, render_item_image(self.item_id, self.item_type, self.key))
+
+
+class RasterWorker(QObject):
+    """
+    后台光栅化，在QThreadPool中计算图元的缓存图像，结果通过信号交回UI线程
+
+    每个图元同时最多保留一个请求，新的请求会撤下尚未开始的旧请求；请求带有版本号，
+    图元参数在计算期间再次改变时，旧版本的结果被丢弃
+    """
+
+    finished = pyqtSignal(object, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.tasks = {}  # item_id -> 最近一次提交的RasterTask
+        self.finished.connect(self.deliver)
+
+    def submit(self, item, version, key):
+        old = self.tasks.get(item.id)
+        if old is not None:
+            self.pool.tryTake(old)
+        task = self.tasks[item.id] = RasterTask(self, item, version, key)
+        self.pool.start(task)
+
+    def deliver(self, task, image):
+        if self.tasks.get(task.item.id) is task:
+            del self.tasks[task.item.id]
+        item = task.item
+        if sip.isdeleted(item) or item.version != task.version:
+            return
+        item.image = image
+        item.image_key = task.key
+        item.pending_key = None
+        item.update()
+
+    def wait(self):
+        """等待所有请求完成并交付结果"""
+        self.pool.waitForDone()
+        QApplication.processEvents()
+
+
+# 后台光栅化线程池，所有图元共用
+raster_worker = RasterWorker()
 
 
 class MyCanvas(QGraphicsView):
@@ -46,9 +166,27 @@ class MyCanvas(QGraphicsView):
         self.origin_p_list = None
         self.trans_center = None
 
+        # 图元包围盒的空间索引，用于在画布中点击选择图元；dirty_rect为本次事件需要重绘的场景区域
+        self.index = cg_spatial.GridIndex()
+        self.dirty_rect = QRectF()
+
+        # 变换拖动过程中只预览（以QTransform作用于图元的缓存图像），鼠标事件合并后按屏幕刷新率更新预览，
+        # 松开鼠标时才计算精确的变换结果并重新光栅化
+        self.pending_pos = None
+        self.preview_params = None
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        screen = QApplication.primaryScreen()
+        refresh_rate = screen.refreshRate() if screen is not None else 0
+        self.preview_timer.setInterval(int(1000 / (refresh_rate if refresh_rate > 0 else 60)))
+        self.preview_timer.timeout.connect(self.update_preview)
+
     def init(self):
         self.scene().clear()
         self.item_dict = {}
+        frame_profiler.reset()
+        self.index = cg_spatial.GridIndex()
+        self.dirty_rect = QRectF()
 
         self.status = ''
         self.temp_algorithm = ''
@@ -95,6 +233,136 @@ class MyCanvas(QGraphicsView):
     def finish_draw(self):
         self.temp_item = None
 
+    def before_change(self, item):
+        """在修改图元参数之前调用：通知场景包围盒将要改变，并将旧的包围盒加入需要重绘的区域"""
+        item.prepareGeometryChange()
+        self.dirty_rect = self.dirty_rect.united(item.boundingRect())
+
+    def after_change(self, item):
+        """在修改图元参数之后调用：更新空间索引，并将新的包围盒加入需要重绘的区域"""
+        if item.id in self.item_dict:
+            self.index.insert(item.id, item.bbox())
+        self.dirty_rect = self.dirty_rect.united(item.boundingRect())
+
+    def flush_dirty(self):
+        """只重绘本次事件中图元新旧包围盒的并集"""
+        if not self.dirty_rect.isNull():
+            self.updateScene([self.dirty_rect])
+        self.dirty_rect = QRectF()
+
+    def add_item(self):
+        """完成绘制的临时图元加入图元列表与空间索引"""
+        self.item_dict[self.temp_id] = self.temp_item
+        self.index.insert(self.temp_id, self.temp_item.bbox())
+        self.list_widget.addItem(self.temp_id)
+        self.finish_draw()
+
+    def select_at(self, x, y, radius=3):
+        """在画布中点击选择图元：从空间索引中取出包围盒靠近点击位置的图元，按绘制顺序从上到下检查其像素"""
+        for item_id in reversed(self.index.query_point(x, y, radius)):
+            item = self.item_dict[item_id]
+            spans = raster_cache.get(item.item_type, item.p_list, item.algorithm)
+            if ((np.abs(spans[:, 0] - y) <= radius) & (spans[:, 1] - radius <= x) & (x <= spans[:, 2] + radius)).any():
+                self.list_widget.setCurrentItem(self.list_widget.findItems(item_id, Qt.MatchExactly)[0])
+                return
+
+    def transform_params(self, x, y):
+        """根据鼠标拖动到的位置计算当前变换的参数
+
+        :param x: (int) 鼠标位置x坐标
+        :param y: (int) 鼠标位置y坐标
+        :return: (tuple) 平移为(dx, dy)，旋转为(r,)（弧度），缩放为(s,)，裁剪为(x0, y0, x1, y1)；无法计算时为None
+        """
+        if self.selected_id == '' or self.origin_pos is None:
+            return None
+        if self.status == 'translate':
+            return x - int(self.origin_pos.x()), y - int(self.origin_pos.y())
+        elif self.status == 'rotate':
+            x_origin, y_origin = int(self.origin_pos.x() - self.trans_center.x()), int(
+                self.origin_pos.y() - self.trans_center.y())
+            len_origin = math.sqrt(x_origin ** 2 + y_origin ** 2)
+            x_now, y_now = x - int(self.trans_center.x()), y - int(self.trans_center.y())
+            len_now = math.sqrt(x_now ** 2 + y_now ** 2)
+            if len_origin != 0 and len_now != 0:
+                sin_origin = y_origin / len_origin
+                cos_origin = x_origin / len_origin
+                sin_now = y_now / len_now
+                cos_now = x_now / len_now
+                delta_sin = sin_now * cos_origin - cos_now * sin_origin
+                delta_cos = cos_now * cos_origin + sin_now * sin_origin
+                if delta_cos >= 0:
+                    r = math.asin(delta_sin)
+                else:
+                    r = math.pi - math.asin(delta_sin)
+                return r,
+        elif self.status == 'scale':
+            x_last, y_last = int(self.origin_pos.x() - self.trans_center.x()), int(
+                self.origin_pos.y() - self.trans_center.y())
+            len_last = math.sqrt(x_last ** 2 + y_last ** 2)
+            if len_last != 0:
+                x_now, y_now = x - int(self.trans_center.x()), y - int(self.trans_center.y())
+                len_now = math.sqrt(x_now ** 2 + y_now ** 2)
+                return len_now / len_last,
+        elif self.status == 'clip':
+            return self.origin_pos.x(), self.origin_pos.y(), x, y
+        return None
+
+    def update_preview(self):
+        """以最近一次鼠标位置更新预览，图元参数保持不变"""
+        if self.pending_pos is None:
+            return
+        params = self.transform_params(*self.pending_pos)
+        self.pending_pos = None
+        if params is None:
+            return
+        self.preview_params = params
+        transform = QTransform()
+        clip_rect = None
+        if self.status == 'translate':
+            transform.translate(*params)
+        elif self.status == 'rotate':
+            cx, cy = int(self.trans_center.x()), int(self.trans_center.y())
+            transform.translate(cx, cy).rotateRadians(params[0]).translate(-cx, -cy)
+        elif self.status == 'scale':
+            cx, cy = int(self.trans_center.x()), int(self.trans_center.y())
+            transform.translate(cx, cy).scale(params[0], params[0]).translate(-cx, -cy)
+        elif self.status == 'clip':
+            x0, y0, x1, y1 = params
+            # 裁剪结果包含窗口边界上的像素
+            clip_rect = QRectF(QPointF(x0, y0), QPointF(x1, y1)).normalized().adjusted(0, 0, 1, 1)
+        self.before_change(self.temp_item)
+        self.temp_item.preview = (transform, clip_rect)
+        self.after_change(self.temp_item)
+        self.flush_dirty()
+
+    def finish_transform(self, event):
+        """松开鼠标时结束预览，对原始参数执行一次精确的变换"""
+        self.preview_timer.stop()
+        self.pending_pos = None
+        pos = self.mapToScene(event.localPos().toPoint())
+        params = self.transform_params(int(pos.x()), int(pos.y()))
+        if params is None:
+            params = self.preview_params
+        self.preview_params = None
+        item = self.temp_item
+        if item is None or item.preview is None and params is None:
+            return
+        self.before_change(item)
+        item.preview = None
+        if params is not None:
+            if self.status == 'translate':
+                item.p_list = alg.translate(self.origin_p_list, *params)
+            elif self.status == 'rotate':
+                item.p_list = alg.rotate(self.origin_p_list, int(self.trans_center.x()), int(self.trans_center.y()),
+                                         params[0], False)
+            elif self.status == 'scale':
+                item.p_list = alg.scale(self.origin_p_list, int(self.trans_center.x()), int(self.trans_center.y()),
+                                        params[0])
+            elif self.status == 'clip':
+                item.p_list = alg.clip(self.origin_p_list, *params, self.temp_algorithm)
+        self.after_change(item)
+        self.flush_dirty()
+
     def clear_selection(self):
         if self.selected_id != '':
             self.item_dict[self.selected_id].selected = False
@@ -106,11 +374,23 @@ class MyCanvas(QGraphicsView):
             if self.selected_id != '':
                 self.item_dict[self.selected_id].selected = False
                 self.item_dict[self.selected_id].update()
+                self.dirty_rect = self.dirty_rect.united(self.item_dict[self.selected_id].boundingRect())
             self.selected_id = selected
             self.item_dict[selected].selected = True
             self.item_dict[selected].update()
+            self.dirty_rect = self.dirty_rect.united(self.item_dict[selected].boundingRect())
             self.status = ''
-            self.updateScene([self.sceneRect()])
+            self.flush_dirty()
+
+    def paintEvent(self, event) -> None:
+        if not frame_profiler.enabled:
+            super().paintEvent(event)
+            return
+        frame_profiler.begin_frame()
+        super().paintEvent(event)
+        frame_profiler.end_frame()
+        if self.main_window is not None:
+            self.main_window.update_profile_label()
 
     def mousePressEvent(self, event: QMouseEvent) -> None:
         pos = self.mapToScene(event.localPos().toPoint())
@@ -120,30 +400,38 @@ class MyCanvas(QGraphicsView):
             self.temp_id = self.main_window.get_id()
             self.temp_item = MyItem(self.temp_id, self.status, [[x, y], [x, y]], self.temp_algorithm, self.temp_color)
             self.scene().addItem(self.temp_item)
+            self.after_change(self.temp_item)
         elif self.status == 'polygon':
             if self.temp_item is None:
                 self.temp_id = self.main_window.get_id()
                 self.temp_item = MyItem(self.temp_id, self.status, [[x, y], [x, y]], self.temp_algorithm,
                                         self.temp_color)
                 self.scene().addItem(self.temp_item)
+                self.after_change(self.temp_item)
             else:
                 x0, y0 = self.temp_item.p_list[0]
                 if (abs(x0 - x) + abs(y0 - y) < 10) and len(self.temp_item.p_list) > 2:
                     self.isPolygonFinish = True
                 else:
+                    self.before_change(self.temp_item)
                     self.temp_item.p_list.append([x, y])
+                    self.after_change(self.temp_item)
         elif self.status == 'ellipse':
             self.temp_id = self.main_window.get_id()
             self.temp_item = MyItem(self.temp_id, self.status, [[x, y], [x, y]], self.temp_algorithm, self.temp_color)
             self.scene().addItem(self.temp_item)
+            self.after_change(self.temp_item)
         elif self.status == 'curve':
             if self.temp_item is None:
                 self.temp_id = self.main_window.get_id()
                 self.temp_item = MyItem(self.temp_id, self.status, [[x, y], [x, y]], self.temp_algorithm,
                                         self.temp_color)
                 self.scene().addItem(self.temp_item)
+                self.after_change(self.temp_item)
             else:
+                self.before_change(self.temp_item)
                 self.temp_item.p_list.append([x, y])
+                self.after_change(self.temp_item)
         elif self.status == 'translate':
             if self.selected_id != '':
                 self.main_window.is_modified = True
@@ -174,13 +462,17 @@ class MyCanvas(QGraphicsView):
                 self.temp_item = self.item_dict[self.selected_id]
                 self.origin_p_list = self.temp_item.p_list
                 self.origin_pos = pos
-        self.updateScene([self.sceneRect()])
+        elif self.status == '':
+            self.select_at(x, y)
+        self.flush_dirty()
         super().mousePressEvent(event)
 
     def mouseMoveEvent(self, event: QMouseEvent) -> None:
         pos = self.mapToScene(event.localPos().toPoint())
         x = int(pos.x())
         y = int(pos.y())
+        if self.status in ('line', 'polygon', 'ellipse', 'curve') and self.temp_item is not None:
+            self.before_change(self.temp_item)
         if self.status == 'line':
             self.temp_item.p_list[-1] = [x, y]
         elif self.status == 'polygon':
@@ -189,93 +481,61 @@ class MyCanvas(QGraphicsView):
             self.temp_item.p_list[-1] = [x, y]
         elif self.status == 'curve':
             self.temp_item.p_list[-1] = [x, y]
-        elif self.status == 'translate':
-            if self.selected_id != '':
-                dx = x - int(self.origin_pos.x())
-                dy = y - int(self.origin_pos.y())
-                self.temp_item.p_list = alg.translate(self.origin_p_list, dx, dy)
-        elif self.status == 'rotate':
-            if self.selected_id != '' and self.trans_center is not None and self.origin_pos is not None:
-                x_origin, y_origin = int(self.origin_pos.x() - self.trans_center.x()), int(
-                    self.origin_pos.y() - self.trans_center.y())
-                len_origin = math.sqrt(x_origin ** 2 + y_origin ** 2)
-                x_now, y_now = x - int(self.trans_center.x()), y - int(self.trans_center.y())
-                len_now = math.sqrt(x_now ** 2 + y_now ** 2)
-                if len_origin != 0 and len_now != 0:
-                    sin_origin = y_origin / len_origin
-                    cos_origin = x_origin / len_origin
-                    sin_now = y_now / len_now
-                    cos_now = x_now / len_now
-                    delta_sin = sin_now * cos_origin - cos_now * sin_origin
-                    delta_cos = cos_now * cos_origin + sin_now * sin_origin
-                    if delta_cos >= 0:
-                        r = math.asin(delta_sin)
-                    else:
-                        r = math.pi - math.asin(delta_sin)
-                    self.temp_item.p_list = alg.rotate(self.origin_p_list, int(self.trans_center.x()),
-                                                       int(self.trans_center.y()), r, False)
-        elif self.status == 'scale':
-            if self.selected_id != '' and self.trans_center is not None and self.origin_pos is not None:
-                x_last, y_last = int(self.origin_pos.x() - self.trans_center.x()), int(
-                    self.origin_pos.y() - self.trans_center.y())
-                len_last = math.sqrt(x_last ** 2 + y_last ** 2)
-                if len_last != 0:
-                    x_now, y_now = x - int(self.trans_center.x()), y - int(self.trans_center.y())
-                    len_now = math.sqrt(x_now ** 2 + y_now ** 2)
-                    self.temp_item.p_list = alg.scale(self.origin_p_list, int(self.trans_center.x()),
-                                                      int(self.trans_center.y()), len_now / len_last)
-        elif self.status == 'clip':
-            if self.selected_id != '':
-                self.temp_item.p_list = alg.clip(self.origin_p_list, self.origin_pos.x(), self.origin_pos.y(), x, y,
-                                                 self.temp_algorithm)
-        self.updateScene([self.sceneRect()])
+        elif self.status in ('translate', 'rotate', 'scale', 'clip'):
+            if self.origin_pos is not None:
+                self.pending_pos = (x, y)
+                if not self.preview_timer.isActive():
+                    self.preview_timer.start()
+        if self.status in ('line', 'polygon', 'ellipse', 'curve') and self.temp_item is not None:
+            self.after_change(self.temp_item)
+        self.flush_dirty()
         super().mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event: QMouseEvent) -> None:
         if self.status == 'line':
-            self.item_dict[self.temp_id] = self.temp_item
-            self.list_widget.addItem(self.temp_id)
-            self.finish_draw()
+            self.add_item()
         elif self.status == 'polygon':
             if self.isPolygonFinish:
                 self.isPolygonFinish = False
-                self.item_dict[self.temp_id] = self.temp_item
-                self.list_widget.addItem(self.temp_id)
-                self.finish_draw()
+                self.add_item()
             else:
                 pos = self.mapToScene(event.localPos().toPoint())
                 x = int(pos.x())
                 y = int(pos.y())
+                self.before_change(self.temp_item)
                 self.temp_item.p_list[-1] = [x, y]
-                self.updateScene([self.sceneRect()])
+                self.after_change(self.temp_item)
+                self.flush_dirty()
         elif self.status == 'ellipse':
-            self.item_dict[self.temp_id] = self.temp_item
-            self.list_widget.addItem(self.temp_id)
-            self.finish_draw()
+            self.add_item()
         elif self.status == 'curve':
             pos = self.mapToScene(event.localPos().toPoint())
             x = int(pos.x())
             y = int(pos.y())
+            self.before_change(self.temp_item)
             self.temp_item.p_list[-1] = [x, y]
-            self.updateScene([self.sceneRect()])
+            self.after_change(self.temp_item)
+            self.flush_dirty()
             if len(self.temp_item.p_list) == self.curvePointNum:
-                self.item_dict[self.temp_id] = self.temp_item
-                self.list_widget.addItem(self.temp_id)
-                self.finish_draw()
+                self.add_item()
         elif self.status == 'translate':
+            self.finish_transform(event)
             self.origin_pos = None
             self.origin_p_list = None
         elif self.status == 'rotate':
             if self.origin_pos is not None:
+                self.finish_transform(event)
                 self.origin_pos = None
                 self.origin_p_list = None
                 self.trans_center = None
         elif self.status == 'scale':
             if self.origin_pos is not None:
+                self.finish_transform(event)
                 self.origin_pos = None
                 self.origin_p_list = None
                 self.trans_center = None
         elif self.status == 'clip':
+            self.finish_transform(event)
             self.origin_pos = None
             self.origin_p_list = None
         super().mouseReleaseEvent(event)
@@ -286,6 +546,11 @@ class MyItem(QGraphicsItem):
     自定义图元类，继承自QGraphicsItem
     """
 
+    # 为True时每个图元只光栅化一次到缓存的QImage中，重绘时直接绘制该图像；为False时逐条水平线段调用drawLine
+    use_image_cache = True
+    # 为True时缓存图像在后台线程中生成，结果返回前绘制控制多边形作为占位
+    use_worker = True
+
     def __init__(self, item_id: str, item_type: str, p_list: list, algorithm: str = '',
                  color: QColor = QColor(0, 0, 0), parent: QGraphicsItem = None):
         """
@@ -303,42 +568,94 @@ class MyItem(QGraphicsItem):
         self.algorithm = algorithm  # 绘制算法，'DDA'、'Bresenham'、'Bezier'、'B-spline'等
         self.color = color
         self.selected = False
-
-    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: Optional[QWidget] = ...) -> None:
-        if self.item_type == 'line':
-            item_pixels = alg.draw_line(self.p_list, self.algorithm)
-            painter.setPen(self.color)
-            for p in item_pixels:
-                painter.drawPoint(*p)
-            if self.selected:
-                painter.setPen(QColor(255, 0, 0))
-                painter.drawRect(self.boundingRect())
+        self.image = None  # 缓存的光栅化图像，为(左上角x, 左上角y, QImage)
+        self.image_key = None  # 生成缓存图像时的(p_list, algorithm, color)，与当前不同时重新生成
+        self.pending_key = None  # 已提交后台光栅化、尚未返回结果的(p_list, algorithm, color)
+        self.version = 0  # 每次提交后台光栅化时加一，用于丢弃过期的结果
+        self.preview = None  # 变换拖动时的预览，为(QTransform, 裁剪窗口QRectF或None)，作用于当前参数的光栅化结果
+
+    def image_cache_key(self):
+        return tuple(tuple(p) for p in self.p_list), self.algorithm, self.color.rgba()
+
+    def ensure_image(self):
+        """在当前线程中生成缓存图像（如保存画布时），不等待后台结果"""
+        key = self.image_cache_key()
+        if key != self.image_key:
+            self.image = render_item_image(self.id, self.item_type, key)
+            self.image_key = key
+            self.pending_key = None
+            self.version += 1
+
+    def paint_placeholder(self, painter: QPainter):
+        """光栅化结果返回前的占位：直接用QPainter绘制控制多边形，椭圆绘制其外接矩形内的椭圆"""
+        painter.setPen(self.color)
+        points = QPolygonF([QPointF(x, y) for x, y in self.p_list])
+        if self.item_type == 'line' or self.item_type == 'curve':
+            painter.drawPolyline(points)
         elif self.item_type == 'polygon':
-            item_pixels = alg.draw_polygon(self.p_list, self.algorithm)
-            painter.setPen(self.color)
-            for p in item_pixels:
-                painter.drawPoint(*p)
-            if self.selected:
-                painter.setPen(QColor(255, 0, 0))
-                painter.drawRect(self.boundingRect())
+            painter.drawPolygon(points)
         elif self.item_type == 'ellipse':
-            item_pixels = alg.draw_ellipse(self.p_list)
-            painter.setPen(self.color)
-            for p in item_pixels:
-                painter.drawPoint(*p)
-            if self.selected:
-                painter.setPen(QColor(255, 0, 0))
-                painter.drawRect(self.boundingRect())
-        elif self.item_type == 'curve':
-            item_pixels = alg.draw_curve(self.p_list, self.algorithm)
-            painter.setPen(self.color)
-            for p in item_pixels:
-                painter.drawPoint(*p)
+            painter.drawEllipse(points.boundingRect())
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: Optional[QWidget] = ...) -> None:
+        if not frame_profiler.enabled:
+            self.paint_item(painter)
+            return
+        version = self.version
+        start = time.perf_counter()
+        self.paint_item(painter)
+        seconds = time.perf_counter() - start
+        image_hit = None
+        if self.use_image_cache:
+            image_hit = self.version == version and self.image_key == self.image_cache_key()
+        frame_profiler.add_paint(self.id, self.item_type, self.algorithm, seconds, image_hit)
+
+    def paint_item(self, painter: QPainter):
+        if self.item_type in ('line', 'polygon', 'ellipse', 'curve'):
+            painter.save()
+            if self.preview is not None:
+                transform, clip_rect = self.preview
+                painter.setTransform(transform, True)
+                if clip_rect is not None:
+                    painter.setClipRect(clip_rect)
+            if self.use_image_cache and self.use_worker:
+                key = self.image_cache_key()
+                if key == self.image_key:
+                    if self.image is not None:
+                        painter.drawImage(self.image[0], self.image[1], self.image[2])
+                else:
+                    if key != self.pending_key:
+                        self.pending_key = key
+                        self.version += 1
+                        raster_worker.submit(self, self.version, key)
+                    self.paint_placeholder(painter)
+            elif self.use_image_cache:
+                self.ensure_image()
+                if self.image is not None:
+                    painter.drawImage(self.image[0], self.image[1], self.image[2])
+            else:
+                spans = raster_cache.get(self.item_type, self.p_list, self.algorithm)
+                painter.setPen(self.color)
+                for y, x_start, x_end in spans.tolist():
+                    painter.drawLine(x_start, y, x_end, y)
+            painter.restore()
             if self.selected:
                 painter.setPen(QColor(255, 0, 0))
                 painter.drawRect(self.boundingRect())
 
+    def bbox(self):
+        """包围盒(x0, y0, x1, y1)，与boundingRect相同"""
+        rect = self.boundingRect()
+        return rect.left(), rect.top(), rect.right(), rect.bottom()
+
     def boundingRect(self) -> QRectF:
+        rect = self.parameter_rect()
+        if self.preview is not None:
+            rect = self.preview[0].mapRect(rect)
+        return rect
+
+    def parameter_rect(self) -> QRectF:
+        """由图元参数计算的包围盒，不含预览变换"""
         if self.item_type == 'line':
             x0, y0 = self.p_list[0]
             x1, y1 = self.p_list[1]
@@ -397,6 +714,8 @@ class MainWindow(QMainWindow):
         set_pen_act = file_menu.addAction('设置画笔')
         reset_canvas_act = file_menu.addAction('重置画布')
         save_canvas_act = file_menu.addAction('保存画布')
+        save_scene_act = file_menu.addAction('保存场景')
+        load_scene_act = file_menu.addAction('打开场景')
         exit_act = file_menu.addAction('退出')
         draw_menu = menubar.addMenu('绘制')
         line_menu = draw_menu.addMenu('线段')
@@ -406,6 +725,7 @@ class MainWindow(QMainWindow):
         polygon_menu = draw_menu.addMenu('多边形')
         polygon_dda_act = polygon_menu.addAction('DDA')
         polygon_bresenham_act = polygon_menu.addAction('Bresenham')
+        polygon_fill_act = polygon_menu.addAction('填充')
         ellipse_act = draw_menu.addAction('椭圆')
         curve_menu = draw_menu.addMenu('曲线')
         curve_bezier_act = curve_menu.addAction('Bezier')
@@ -417,11 +737,17 @@ class MainWindow(QMainWindow):
         clip_menu = edit_menu.addMenu('裁剪')
         clip_cohen_sutherland_act = clip_menu.addAction('Cohen-Sutherland')
         clip_liang_barsky_act = clip_menu.addAction('Liang-Barsky')
+        profile_menu = menubar.addMenu('性能')
+        profile_act = profile_menu.addAction('显示重绘统计')
+        profile_act.setCheckable(True)
+        dump_profile_act = profile_menu.addAction('导出图元开销排名')
 
         # 连接信号和槽函数
         set_pen_act.triggered.connect(self.set_pen_action)
         reset_canvas_act.triggered.connect(self.reset_canvas_action)
         save_canvas_act.triggered.connect(self.save_canvas_action)
+        save_scene_act.triggered.connect(self.save_scene_action)
+        load_scene_act.triggered.connect(self.load_scene_action)
         exit_act.triggered.connect(qApp.quit)
 
         line_naive_act.triggered.connect(self.line_naive_action)
@@ -430,6 +756,7 @@ class MainWindow(QMainWindow):
 
         polygon_dda_act.triggered.connect(self.polygon_dda_action)
         polygon_bresenham_act.triggered.connect(self.polygon_bresenham_action)
+        polygon_fill_act.triggered.connect(self.polygon_fill_action)
 
         ellipse_act.triggered.connect(self.ellipse_action)
 
@@ -443,6 +770,9 @@ class MainWindow(QMainWindow):
         clip_cohen_sutherland_act.triggered.connect(self.clip_cohen_sutherland_action)
         clip_liang_barsky_act.triggered.connect(self.clip_liang_barsky_action)
 
+        profile_act.toggled.connect(self.profile_action)
+        dump_profile_act.triggered.connect(self.dump_profile_action)
+
         self.list_widget.currentTextChanged.connect(self.canvas_widget.selection_changed)
 
         # 设置主窗口的布局
@@ -452,6 +782,10 @@ class MainWindow(QMainWindow):
         self.central_widget = QWidget()
         self.central_widget.setLayout(self.hbox_layout)
         self.setCentralWidget(self.central_widget)
+        # 重绘统计显示在状态栏右侧，开启后每帧更新
+        self.profile_label = QLabel(self)
+        self.profile_label.hide()
+        self.statusBar().addPermanentWidget(self.profile_label)
         self.statusBar().showMessage('空闲')
         self.resize(600, 600)
         self.setWindowTitle('CG Demo')
@@ -510,10 +844,80 @@ class MainWindow(QMainWindow):
             painter = QPainter()
             painter.begin(pix)
             for item in canvas.item_dict:
+                canvas.item_dict[item].ensure_image()
                 canvas.item_dict[item].paint(painter, QStyleOptionGraphicsItem)
             painter.end()
             pix.save(filename[0])
 
+    def save_scene_action(self):
+        self.statusBar().showMessage('保存场景')
+        filename = QFileDialog.getSaveFileName(self, filter="Scene Files(*.scene)")
+        if filename[0]:
+            self.save_scene(filename[0])
+        self.statusBar().showMessage('空闲')
+
+    def load_scene_action(self):
+        self.statusBar().showMessage('打开场景')
+        filename = QFileDialog.getOpenFileName(self, filter="Scene Files(*.scene)")
+        if filename[0]:
+            try:
+                self.load_scene(filename[0])
+            except (OSError, ValueError) as e:
+                QMessageBox.critical(self, 'Error', str(e))
+        self.statusBar().showMessage('空闲')
+
+    def profile_action(self, checked):
+        frame_profiler.enabled = checked
+        self.profile_label.setVisible(checked)
+        if checked:
+            frame_profiler.reset()
+            self.profile_label.setText('重绘统计：等待重绘')
+            self.canvas_widget.viewport().update()
+
+    def dump_profile_action(self):
+        filename = QFileDialog.getSaveFileName(self, filter="Text Files(*.txt)")
+        if filename[0]:
+            self.dump_profile(filename[0])
+
+    def update_profile_label(self):
+        """在状态栏显示最近一帧的耗时、绘制的图元数、光栅化的像素数，以及缓存命中率"""
+        seconds, items, pixels = frame_profiler.frames[-1]
+        self.profile_label.setText('帧 %.1f ms（平均 %.1f ms） 图元 %d 像素 %d 图像缓存 %.0f%% 光栅化缓存 %.0f%%' % (
+            seconds * 1e3, frame_profiler.mean_frame_time() * 1e3, items, pixels,
+            frame_profiler.image_hit_rate() * 100, raster_cache.hit_rate() * 100))
+
+    def dump_profile(self, path):
+        """将各图元累计的绘制与光栅化开销按总耗时降序写入文本文件"""
+        with open(path, 'w') as fp:
+            fp.write(frame_profiler.report() + '\n')
+
+    def save_scene(self, path):
+        """将画布尺寸与全部图元写入场景文件"""
+        scene = cg_scene.Scene.from_items(int(self.scene.width()), int(self.scene.height()), (
+            (item.id, item.item_type, item.p_list, item.algorithm, item.color.getRgb())
+            for item in self.canvas_widget.item_dict.values()))
+        cg_scene.save(path, scene)
+
+    def load_scene(self, path):
+        """以场景文件中的画布与图元替换当前画布"""
+        scene = cg_scene.load(path)
+        self.list_widget.clearSelection()
+        self.canvas_widget.clear_selection()
+        self.list_widget.clear()
+        self.canvas_widget.init()
+        self.scene.setSceneRect(0, 0, scene.width, scene.height)
+        canvas = self.canvas_widget
+        item_cnt = 0
+        for item_id, item_type, p_list, algorithm, color in scene.items():
+            item = MyItem(item_id, item_type, p_list, algorithm, QColor(*color.tolist()))
+            self.scene.addItem(item)
+            canvas.item_dict[item_id] = item
+            canvas.index.insert(item_id, item.bbox())
+            if item_id.isdigit():
+                item_cnt = max(item_cnt, int(item_id) + 1)
+        self.list_widget.addItems(scene.ids)
+        self.item_cnt = item_cnt
+
     def line_naive_action(self):
         self.canvas_widget.start_draw_line('Naive')
         self.statusBar().showMessage('Naive算法绘制线段')
@@ -544,6 +948,12 @@ class MainWindow(QMainWindow):
         self.list_widget.clearSelection()
         self.canvas_widget.clear_selection()
 
+    def polygon_fill_action(self):
+        self.canvas_widget.start_draw_polygon('Fill')
+        self.statusBar().showMessage('扫描线算法填充polygon')
+        self.list_widget.clearSelection()
+        self.canvas_widget.clear_selection()
+
     def ellipse_action(self):
         self.canvas_widget.start_draw_ellipse()
         self.statusBar().showMessage('绘制椭圆')
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+
+import cg_cache
+
+
+class Profiler:
+    """
+    记录各类操作的耗时、调用次数与像素数，输出汇总表与Chrome trace-event格式的JSON（可在chrome://tracing或Perfetto中查看）
+
+    统计项以(kind, name)区分：kind为'command'（脚本命令）、'phase'（命令内部的阶段，如渲染、编码）、
+    'rasterize'（光栅化，name为'图元类型/算法'）或'parse'（读取与切分脚本）
+    """
+
+    def __init__(self, trace=False, origin=None):
+        """
+
+        :param trace: (bool) 是否记录每次操作的trace事件
+        :param origin: (float) trace事件时间的零点（time.perf_counter），子进程使用父进程的零点以便合并
+        """
+        self.stats = {}  # (kind, name) -> [调用次数, 总耗时（秒）, 像素数]
+        self.events = [] if trace else None
+        self.pixels = 0  # 已光栅化的像素总数，用于计算每条命令产生的像素数
+        self.origin = time.perf_counter() if origin is None else origin
+        self.pid = os.getpid()
+
+    def add(self, kind, name, start, end, pixels=0, args=None):
+        """记录一次操作
+
+        :param start: (float) 开始时间（time.perf_counter）
+        :param end: (float) 结束时间（time.perf_counter）
+        :param pixels: (int) 该操作产生的像素数
+        :param args: (dict) trace事件中附带的参数
+        """
+        stat = self.stats.get((kind, name))
+        if stat is None:
+            stat = self.stats[(kind, name)] = [0, 0.0, 0]
+        stat[0] += 1
+        stat[1] += end - start
+        stat[2] += pixels
+        if self.events is not None:
+            self.events.append({'name': name, 'cat': kind, 'ph': 'X', 'pid': self.pid, 'tid': 0,
+                                'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6, 'args': args or {}})
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add('phase', name, start, time.perf_counter())
+
+    def wrap_rasterizer(self, rasterizer, raster_format='pixels'):
+        """包装光栅化函数，按图元类型与算法记录耗时与像素数
+
+        :param rasterizer: (callable: (item_type, p_list, algorithm) -> pixels) 光栅化函数
+        :param raster_format: (string) 光栅化结果的格式，见cg_cache.is_spans
+        :return: (callable) 参数与返回值相同的光栅化函数
+        """
+        def rasterize(item_type, p_list, algorithm):
+            start = time.perf_counter()
+            pixels = rasterizer(item_type, p_list, algorithm)
+            count = cg_cache.pixel_count(item_type, algorithm, pixels, raster_format)
+            self.pixels += count
+            self.add('rasterize', '%s/%s' % (item_type, algorithm), start, time.perf_counter(), count)
+            return pixels
+
+        return rasterize
+
+    def timed_commands(self, commands):
+        """包装命令迭代器，将读取与切分脚本的时间累计为('parse', 'script')，不记录trace事件"""
+        stat = self.stats.setdefault(('parse', 'script'), [0, 0.0, 0])
+        commands = iter(commands)
+        while True:
+            start = time.perf_counter()
+            try:
+                command = next(commands)
+            except StopIteration:
+                stat[1] += time.perf_counter() - start
+                return
+            stat[0] += 1
+            stat[1] += time.perf_counter() - start
+            yield command
+
+    def reset(self):
+        """清空已记录的数据"""
+        self.stats = {}
+        self.events = [] if self.events is not None else None
+        self.pixels = 0
+
+    def export(self):
+        """导出为可pickle的数据，用于从子进程汇总"""
+        return self.stats, self.events, self.pixels
+
+    def merge(self, data):
+        """合并export导出的数据"""
+        stats, events, pixels = data
+        for key, (calls, seconds, count) in stats.items():
+            stat = self.stats.setdefault(key, [0, 0.0, 0])
+            stat[0] += calls
+            stat[1] += seconds
+            stat[2] += count
+        if self.events is not None and events is not None:
+            self.events.extend(events)
+        self.pixels += pixels
+
+    def summary(self):
+        """
+        :return: (string) 汇总表：按命令、阶段、光栅化，以及按图元类型、按算法分组，各组内按总耗时降序排列
+        """
+        groups = {}
+        for (kind, name), stat in self.stats.items():
+            groups.setdefault(kind, {})[name] = stat
+            if kind == 'rasterize':
+                item_type, algorithm = name.split('/', 1)
+                for group, key in (('primitive', item_type), ('algorithm', algorithm)):
+                    total = groups.setdefault(group, {}).setdefault(key, [0, 0.0, 0])
+                    for i in range(3):
+                        total[i] += stat[i]
+        lines = ['%-10s %-28s %10s %12s %12s %14s' % ('kind', 'name', 'calls', 'total (s)', 'mean (us)', 'pixels')]
+        for kind in ('parse', 'command', 'phase', 'rasterize', 'primitive', 'algorithm'):
+            for name, (calls, seconds, pixels) in sorted(groups.get(kind, {}).items(), key=lambda kv: -kv[1][1]):
+                lines.append('%-10s %-28s %10d %12.4f %12.1f %14d' % (
+                    kind, name, calls, seconds, seconds / calls * 1e6 if calls else 0.0, pixels))
+        return '\n'.join(lines)
+
+    def write_trace(self, path):
+        """写出Chrome trace-event格式的JSON"""
+        with open(path, 'w') as fp:
+            json.dump({'traceEvents': self.events or [], 'displayTimeUnit': 'ms'}, fp)
+
+
+class FrameProfiler:
+    """
+    GUI重绘的统计：每帧（视口的一次重绘）的耗时、绘制的图元数与光栅化的像素数，缓存图像的命中率，
+    以及每个图元累计的绘制与光栅化耗时
+
+    光栅化可能在后台线程中进行，相关计数在锁内更新；enabled为False时调用者不记录任何数据
+    """
+
+    def __init__(self, history=60):
+        """
+
+        :param history: (int) 保留最近多少帧的记录
+        """
+        self.enabled = False
+        self.frames = collections.deque(maxlen=history)  # (耗时（秒）, 绘制的图元数, 光栅化的像素数)
+        self.items = {}  # item_id -> [类型, 算法, 绘制次数, 绘制耗时, 光栅化次数, 光栅化耗时, 像素数]
+        self.image_hits = 0
+        self.image_misses = 0
+        self.pixels = 0  # 已光栅化的像素总数
+        self._frame_start = None
+        self._frame_items = 0
+        self._frame_pixels = 0  # 上一帧结束时的pixels
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def reset(self):
+        with self._lock:
+            self.frames.clear()
+            self.items = {}
+            self.image_hits = 0
+            self.image_misses = 0
+            self._frame_pixels = self.pixels
+
+    def _item(self, item_id, item_type, algorithm):
+        stat = self.items.get(item_id)
+        if stat is None:
+            stat = self.items[item_id] = [item_type, algorithm, 0, 0.0, 0, 0.0, 0]
+        return stat
+
+    def wrap_rasterizer(self, rasterizer, raster_format='pixels'):
+        """包装光栅化函数，启用时累计像素数（总数及当前线程中正在记录的光栅化）
+
+        :param rasterizer: (callable: (item_type, p_list, algorithm) -> pixels) 光栅化函数
+        :param raster_format: (string) 光栅化结果的格式，见cg_cache.is_spans
+        :return: (callable) 参数与返回值相同的光栅化函数
+        """
+        def rasterize(item_type, p_list, algorithm):
+            pixels = rasterizer(item_type, p_list, algorithm)
+            if self.enabled:
+                count = cg_cache.pixel_count(item_type, algorithm, pixels, raster_format)
+                with self._lock:
+                    self.pixels += count
+                self._local.pixels = getattr(self._local, 'pixels', 0) + count
+            return pixels
+
+        return rasterize
+
+    @contextlib.contextmanager
+    def raster(self, item_id, item_type, algorithm):
+        """记录图元的一次光栅化（可在后台线程中），像素数由wrap_rasterizer包装的函数在同一线程中累计"""
+        self._local.pixels = 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                stat = self._item(item_id, item_type, algorithm)
+                stat[4] += 1
+                stat[5] += seconds
+                stat[6] += self._local.pixels
+
+    def begin_frame(self):
+        self._frame_start = time.perf_counter()
+        self._frame_items = 0
+
+    def end_frame(self):
+        seconds = time.perf_counter() - self._frame_start
+        with self._lock:
+            pixels = self.pixels - self._frame_pixels
+            self._frame_pixels = self.pixels
+        self.frames.append((seconds, self._frame_items, pixels))
+
+    def add_paint(self, item_id, item_type, algorithm, seconds, image_hit=None):
+        """记录图元的一次绘制
+
+        :param seconds: (float) 绘制耗时（秒）
+        :param image_hit: (bool) 是否直接使用了缓存图像，未使用图像缓存时为None
+        """
+        self._frame_items += 1
+        if image_hit is not None:
+            if image_hit:
+                self.image_hits += 1
+            else:
+                self.image_misses += 1
+        with self._lock:
+            stat = self._item(item_id, item_type, algorithm)
+            stat[2] += 1
+            stat[3] += seconds
+
+    def image_hit_rate(self):
+        total = self.image_hits + self.image_misses
+        return self.image_hits / total if total else 0.0
+
+    def mean_frame_time(self):
+        return sum(f[0] for f in self.frames) / len(self.frames) if self.frames else 0.0
+
+    def ranking(self):
+        """
+        :return: (list of tuple: (item_id, item_type, algorithm, paints, paint_seconds, rasters, raster_seconds, pixels))
+            各图元的累计开销，按绘制与光栅化的总耗时降序排列
+        """
+        with self._lock:
+            rows = [(item_id,) + tuple(stat) for item_id, stat in self.items.items()]
+        rows.sort(key=lambda row: -(row[4] + row[6]))
+        return rows
+
+    def report(self):
+        """
+        :return: (string) 各图元累计开销的排名表
+        """
+        lines = ['%-12s %-8s %-12s %8s %12s %8s %12s %12s' % (
+            'id', 'type', 'algorithm', 'paints', 'paint (ms)', 'rasters', 'raster (ms)', 'pixels')]
+        for item_id, item_type, algorithm, paints, paint_seconds, rasters, raster_seconds, pixels in self.ranking():
+            lines.append('%-12s %-8s %-12s %8d %12.3f %8d %12.3f %12d' % (
+                item_id, item_type, algorithm, paints, paint_seconds * 1e3, rasters, raster_seconds * 1e3, pixels))
+        return '\n'.join(lines)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+import numpy as np
+
+# 场景文件格式（小端）：文件头HEADER之后依次为以下各列，每列的起始位置按8字节对齐，位置与字节数记录在文件头中
+#   types       uint8 (N,)      图元类型在TYPES中的下标
+#   algorithms  uint8 (N,)      绘制算法在算法名表names中的下标
+#   colors      uint8 (N, 3)    RGB颜色
+#   offsets     int64 (N + 1,)  第i个图元的点为points[offsets[i]:offsets[i + 1]]
+#   points      int32 (M, 2)    所有图元的点依次拼接
+#   ids         以'\n'连接的图元ID（UTF-8）
+#   names       以'\n'连接的算法名表（UTF-8）
+# 读取时整个文件以numpy.memmap映射，各列直接作为数组视图，不需要逐个图元解析
+
+MAGIC = b'CGSCENE1'
+TYPES = ('line', 'polygon', 'ellipse', 'curve')
+COLUMNS = ('types', 'algorithms', 'colors', 'offsets', 'points', 'ids', 'names')
+HEADER = np.dtype([('magic', 'S8'), ('width', '<u4'), ('height', '<u4'), ('n_items', '<u8'),
+                   ('sections', '<u8', (len(COLUMNS), 2))])
+
+
+class Scene:
+    """
+    以列存储的场景，第i个图元的ID为ids[i]，类型为TYPES[types[i]]，绘制算法为names[algorithms[i]]，
+    颜色为colors[i]，参数为points[offsets[i]:offsets[i + 1]]
+    """
+
+    def __init__(self, width, height, ids, types, algorithms, names, colors, offsets, points):
+        """
+
+        :param width: (int) 画布宽度
+        :param height: (int) 画布高度
+        :param ids: (list of string) 图元ID，不能包含换行符
+        :param types: (numpy.ndarray of uint8: (N,)) 图元类型在TYPES中的下标
+        :param algorithms: (numpy.ndarray of uint8: (N,)) 绘制算法在names中的下标
+        :param names: (list of string) 算法名表
+        :param colors: (numpy.ndarray of uint8: (N, 3)) RGB颜色
+        :param offsets: (numpy.ndarray of int64: (N + 1,)) 各图元的点在points中的起止位置
+        :param points: (numpy.ndarray of int32: (M, 2)) 所有图元的点
+        """
+        self.width = width
+        self.height = height
+        self.ids = ids
+        self.types = types
+        self.algorithms = algorithms
+        self.names = names
+        self.colors = colors
+        self.offsets = offsets
+        self.points = points
+
+    @classmethod
+    def from_items(cls, width, height, items):
+        """由逐个图元构造场景
+
+        :param items: (iterable of tuple: (item_id, item_type, p_list, algorithm, color)) 图元，color为(r, g, b)
+        """
+        ids = []
+        types = []
+        algorithms = []
+        names = {}
+        colors = []
+        counts = []
+        points = []
+        type_index = {t: i for i, t in enumerate(TYPES)}
+        for item_id, item_type, p_list, algorithm, color in items:
+            ids.append(item_id)
+            types.append(type_index[item_type])
+            algorithms.append(names.setdefault(algorithm, len(names)))
+            colors.append(color[:3])
+            counts.append(len(p_list))
+            points.extend(p_list)
+        if len(names) > 256:
+            raise ValueError('too many algorithm names: %d' % len(names))
+        offsets = np.zeros(len(ids) + 1, np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return cls(width, height, ids, np.array(types, np.uint8), np.array(algorithms, np.uint8), list(names),
+                   np.array(colors, np.uint8).reshape(-1, 3), offsets, np.array(points, np.int32).reshape(-1, 2))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def items(self):
+        """逐个给出图元
+
+        :return: (generator of tuple: (item_id, item_type, p_list, algorithm, color)) p_list为list of list of int，
+            color为numpy.ndarray of uint8: (3,)
+        """
+        points = self.points.tolist()
+        offsets = self.offsets.tolist()
+        types = self.types.tolist()
+        algorithms = self.algorithms.tolist()
+        colors = np.array(self.colors)
+        for i, item_id in enumerate(self.ids):
+            yield (item_id, TYPES[types[i]], points[offsets[i]:offsets[i + 1]], self.names[algorithms[i]],
+                   colors[i])
+
+
+def save(path, scene):
+    """将场景写入文件
+
+    :param path: (string) 文件路径
+    :param scene: (Scene) 场景
+    """
+    columns = [
+        np.ascontiguousarray(scene.types, '<u1'),
+        np.ascontiguousarray(scene.algorithms, '<u1'),
+        np.ascontiguousarray(scene.colors, '<u1'),
+        np.ascontiguousarray(scene.offsets, '<i8'),
+        np.ascontiguousarray(scene.points, '<i4'),
+        np.frombuffer('\n'.join(scene.ids).encode('utf-8'), np.uint8),
+        np.frombuffer('\n'.join(scene.names).encode('utf-8'), np.uint8),
+    ]
+    header = np.zeros((), HEADER)
+    header['magic'] = MAGIC
+    header['width'] = scene.width
+    header['height'] = scene.height
+    header['n_items'] = len(scene)
+    position = HEADER.itemsize
+    for k, column in enumerate(columns):
+        position += -position % 8
+        header['sections'][k] = position, column.nbytes
+        position += column.nbytes
+    with open(path, 'wb') as fp:
+        fp.write(header.tobytes())
+        for k, column in enumerate(columns):
+            fp.write(b'\0' * (int(header['sections'][k][0]) - fp.tell()))
+            fp.write(column.tobytes())
+
+
+def load(path):
+    """以numpy.memmap映射场景文件，各数组列为只读的文件映射视图
+
+    :param path: (string) 文件路径
+    :return: (Scene) 场景
+    """
+    data = np.memmap(path, np.uint8, 'r')
+    if data.size < HEADER.itemsize or bytes(data[:len(MAGIC)]) != MAGIC:
+        raise ValueError('%s is not a scene file' % path)
+    header = data[:HEADER.itemsize].view(HEADER)[0]
+    if data.size < max(int(start + size) for start, size in header['sections']):
+        raise ValueError('%s is truncated' % path)
+    sections = [data[int(start):int(start + size)] for start, size in header['sections']]
+    types, algorithms, colors, offsets, points, ids, names = sections
+    n_items = int(header['n_items'])
+    return Scene(int(header['width']), int(header['height']),
+                 bytes(ids).decode('utf-8').split('\n') if n_items else [],
+                 types, algorithms, bytes(names).decode('utf-8').split('\n') if n_items else [],
+                 colors.reshape(-1, 3), offsets.view('<i8'), points.view('<i4').reshape(-1, 2))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+
+class GridIndex:
+    """
+    均匀网格空间索引，记录每个图元包围盒所覆盖的网格单元，用于按点或矩形快速查找图元
+    """
+
+    def __init__(self, cell_size=64):
+        """
+
+        :param cell_size: (int) 网格单元的边长（像素）
+        """
+        self.cell_size = cell_size
+        self.cells = {}  # (cx, cy) -> 包围盒覆盖该单元的图元ID集合
+        self.boxes = {}  # item_id -> 包围盒(x0, y0, x1, y1)
+        self.order = {}  # item_id -> 插入顺序，查询结果按此排序
+        self.counter = 0
+
+    def _cell_range(self, box):
+        x0, y0, x1, y1 = box
+        size = self.cell_size
+        return range(int(x0 // size), int(x1 // size) + 1), range(int(y0 // size), int(y1 // size) + 1)
+
+    def insert(self, item_id, box):
+        """插入图元或更新已有图元的包围盒
+
+        :param item_id: 图元ID
+        :param box: (tuple: (x0, y0, x1, y1)) 包围盒，x0 <= x1，y0 <= y1
+        """
+        old = self.boxes.get(item_id)
+        if old is not None:
+            if self._cell_range(old) == self._cell_range(box):
+                self.boxes[item_id] = box
+                return
+            self._unlink(item_id, old)
+        else:
+            self.order[item_id] = self.counter
+            self.counter += 1
+        self.boxes[item_id] = box
+        xs, ys = self._cell_range(box)
+        for cx in xs:
+            for cy in ys:
+                self.cells.setdefault((cx, cy), set()).add(item_id)
+
+    def remove(self, item_id):
+        box = self.boxes.pop(item_id, None)
+        if box is not None:
+            self._unlink(item_id, box)
+            del self.order[item_id]
+
+    def _unlink(self, item_id, box):
+        xs, ys = self._cell_range(box)
+        for cx in xs:
+            for cy in ys:
+                cell = self.cells[(cx, cy)]
+                cell.discard(item_id)
+                if not cell:
+                    del self.cells[(cx, cy)]
+
+    def query(self, box):
+        """查找包围盒与给定矩形相交的图元
+
+        :param box: (tuple: (x0, y0, x1, y1)) 矩形
+        :return: (list) 图元ID，按插入顺序排列（最后绘制的在最后）
+        """
+        x0, y0, x1, y1 = box
+        xs, ys = self._cell_range(box)
+        candidates = set()
+        for cx in xs:
+            for cy in ys:
+                candidates.update(self.cells.get((cx, cy), ()))
+        result = []
+        for item_id in candidates:
+            bx0, by0, bx1, by1 = self.boxes[item_id]
+            if bx0 <= x1 and x0 <= bx1 and by0 <= y1 and y0 <= by1:
+                result.append(item_id)
+        result.sort(key=self.order.__getitem__)
+        return result
+
+    def query_point(self, x, y, radius=0):
+        """查找包围盒与以(x, y)为中心、边长为2 * radius的正方形相交的图元"""
+        return self.query((x - radius, y - radius, x + radius, y + radius))
+
+    def __len__(self):
+        return len(self.boxes)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+import numpy as np
+
+import cg_scene
+
+TYPES = cg_scene.TYPES
+TYPE_CODES = {t: i for i, t in enumerate(TYPES)}
+
+
+class ItemStore:
+    """
+    按列存储的图元集合：类型、算法、颜色各为一个紧凑数组，所有图元的参数点存放在同一个int32缓冲区中
+
+    每个图元占用一个槽位，槽位顺序即插入顺序（重新定义已有ID的图元时沿用原槽位，与dict的行为相同）；
+    第i个槽位的参数点为points[starts[i]:starts[i] + counts[i]]。参数点变多时写到缓冲区末尾，
+    废弃的空间在超过有效数据时整理回收
+    """
+
+    def __init__(self, capacity=64):
+        """
+
+        :param capacity: (int) 初始槽位数，不足时自动扩充
+        """
+        self.slots = {}  # item_id -> 槽位
+        self.ids = []  # 槽位 -> item_id
+        self.names = []  # 算法名表，algorithms中为下标
+        self.name_codes = {}
+        self.types = np.zeros(capacity, np.uint8)
+        self.algorithms = np.zeros(capacity, np.uint8)
+        self.colors = np.zeros((capacity, 3), np.uint8)
+        self.starts = np.zeros(capacity, np.int64)
+        self.counts = np.zeros(capacity, np.int32)
+        self.points = np.zeros((capacity * 4, 2), np.int32)
+        self.used = 0  # points中已写入的行数（含废弃的空间）
+        self.live = 0  # points中有效的行数
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, item_id):
+        return item_id in self.slots
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def keys(self):
+        """图元ID的集合视图，按插入顺序排列"""
+        return self.slots.keys()
+
+    def algorithm_code(self, algorithm):
+        code = self.name_codes.get(algorithm)
+        if code is None:
+            if len(self.names) == 256:
+                raise ValueError('too many algorithm names')
+            code = self.name_codes[algorithm] = len(self.names)
+            self.names.append(algorithm)
+        return code
+
+    def _grow_slots(self, size):
+        capacity = max(size, 2 * len(self.types))
+        for name in ('types', 'algorithms', 'colors', 'starts', 'counts'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _reserve_points(self, count):
+        """在points末尾留出count行，返回其起始位置"""
+        if self.used + count > len(self.points):
+            if self.used - self.live > self.live:
+                self.compact()
+            if self.used + count > len(self.points):
+                points = np.zeros((max(self.used + count, 2 * len(self.points)), 2), np.int32)
+                points[:self.used] = self.points[:self.used]
+                self.points = points
+        start = self.used
+        self.used += count
+        return start
+
+    def compact(self):
+        """按槽位顺序重新排列参数点，回收废弃的空间"""
+        points, offsets = self.gather()
+        n = len(self.ids)
+        self.points[:len(points)] = points
+        self.starts[:n] = offsets[:-1]
+        self.used = self.live = len(points)
+
+    def gather(self, item_ids=None):
+        """将图元的参数点依次拼接
+
+        :param item_ids: (list) 图元ID，默认为按槽位顺序的全部图元
+        :return: (tuple: (numpy.ndarray of int32: (M, 2), numpy.ndarray of int64: (N + 1,))) 参数点与各图元的起止位置
+        """
+        index, offsets = self._point_index(item_ids)
+        return self.points[index], offsets
+
+    def scatter(self, item_ids, points, offsets):
+        """以gather的格式批量替换图元参数，各图元的点数不变时直接写回缓冲区
+
+        :param item_ids: (list) 图元ID，不能重复
+        :param points: (array-like: (M, 2)) 各图元的参数点依次拼接
+        :param offsets: (array-like of int: (N + 1,)) 第k个图元的参数点为points[offsets[k]:offsets[k + 1]]
+        """
+        slots = np.array([self.slots[item_id] for item_id in item_ids], np.int64)
+        offsets = np.asarray(offsets, np.int64)
+        if np.array_equal(np.diff(offsets), self.counts[slots]):
+            index, _ = self._point_index(item_ids)
+            self.points[index] = points
+        else:
+            for k, item_id in enumerate(item_ids):
+                self.set_points(item_id, points[offsets[k]:offsets[k + 1]])
+
+    def _point_index(self, item_ids):
+        if item_ids is None:
+            n = len(self.ids)
+            starts, counts = self.starts[:n], self.counts[:n]
+        else:
+            slots = np.array([self.slots[item_id] for item_id in item_ids], np.int64)
+            starts, counts = self.starts[slots], self.counts[slots]
+        offsets = np.zeros(len(counts) + 1, np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return np.arange(offsets[-1]) + np.repeat(starts - offsets[:-1], counts), offsets
+
+    def add(self, item_id, item_type, p_list, algorithm, color):
+        """加入图元，ID已存在时替换原图元
+
+        :param item_type: (string) 图元类型
+        :param p_list: (list of list of int 或 numpy.ndarray) 图元参数
+        :param algorithm: (string) 绘制算法
+        :param color: (array-like: (3,)) RGB颜色
+        """
+        slot = self.slots.get(item_id)
+        if slot is None:
+            slot = len(self.ids)
+            if slot == len(self.types):
+                self._grow_slots(slot + 1)
+            self.slots[item_id] = slot
+            self.ids.append(item_id)
+        self.types[slot] = TYPE_CODES[item_type]
+        self.algorithms[slot] = self.algorithm_code(algorithm)
+        self.colors[slot] = color
+        self._write_points(slot, p_list)
+
+    def set_points(self, item_id, p_list):
+        """替换图元参数"""
+        self._write_points(self.slots[item_id], p_list)
+
+    def _write_points(self, slot, p_list):
+        points = np.asarray(p_list, dtype=np.int32).reshape(-1, 2)
+        count = len(points)
+        old = int(self.counts[slot])
+        if count > old:
+            self.counts[slot] = 0
+            self.live -= old
+            self.starts[slot] = self._reserve_points(count)
+            self.live += count
+        else:
+            self.live += count - old
+        start = int(self.starts[slot])
+        self.points[start:start + count] = points
+        self.counts[slot] = count
+
+    def point_array(self, item_id):
+        """图元参数（缓冲区视图，在下一次修改之前有效）
+
+        :return: (numpy.ndarray of int32: (N, 2)) 图元参数
+        """
+        slot = self.slots[item_id]
+        start = int(self.starts[slot])
+        return self.points[start:start + self.counts[slot]]
+
+    def p_list(self, item_id):
+        return self.point_array(item_id).tolist()
+
+    def item(self, item_id):
+        """
+        :return: (tuple: (item_type, p_list, algorithm, color)) 图元，color为numpy.ndarray of uint8: (3,)
+        """
+        slot = self.slots[item_id]
+        return (TYPES[self.types[slot]], self.p_list(item_id), self.names[self.algorithms[slot]],
+                self.colors[slot].copy())
+
+    def packed_colors(self):
+        """
+        :return: (numpy.ndarray of int64: (N,)) 各槽位的颜色，打包为0xRRGGBB
+        """
+        colors = self.colors[:len(self.ids)].astype(np.int64)
+        return colors[:, 0] << 16 | colors[:, 1] << 8 | colors[:, 2]
+
+    def to_scene(self, width, height):
+        points, offsets = self.gather()
+        n = len(self.ids)
+        return cg_scene.Scene(width, height, list(self.ids), self.types[:n], self.algorithms[:n], list(self.names),
+                              self.colors[:n], offsets, points)
+
+    def load_scene(self, scene):
+        """加入场景中的全部图元，场景中的数组整列复制，不逐个图元转换"""
+        if self.ids or len(set(scene.ids)) != len(scene.ids):
+            for item_id, item_type, p_list, algorithm, color in scene.items():
+                self.add(item_id, item_type, p_list, algorithm, color)
+            return
+        n = len(scene.ids)
+        if n > len(self.types):
+            self._grow_slots(n)
+        codes = np.array([self.algorithm_code(name) for name in scene.names], np.uint8)
+        self.slots = {item_id: slot for slot, item_id in enumerate(scene.ids)}
+        self.ids = list(scene.ids)
+        self.types[:n] = scene.types
+        self.algorithms[:n] = codes[scene.algorithms] if n else 0
+        self.colors[:n] = scene.colors
+        offsets = np.asarray(scene.offsets, np.int64)
+        self.starts[:n] = offsets[:-1]
+        self.counts[:n] = np.diff(offsets)
+        self.points = np.array(scene.points, np.int32).reshape(-1, 2)
+        self.used = self.live = len(self.points)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+import math
+
+import numpy as np
+
+
+# 本文件以3x3齐次坐标矩阵表示平移、旋转、缩放变换，与cg_algorithms中translate、rotate、scale的定义一致，
+# 多次变换先复合为一个矩阵，再一次性作用于整个点集
+
+
+def translation(dx, dy):
+    """平移变换矩阵
+
+    :param dx: (int) 水平方向平移量
+    :param dy: (int) 垂直方向平移量
+    :return: (numpy.ndarray of float64: (3, 3)) 变换矩阵
+    """
+    return np.array([[1, 0, dx], [0, 1, dy], [0, 0, 1]], np.float64)
+
+
+def rotation(x, y, r, unit=True):
+    """旋转变换矩阵
+
+    :param x: (int) 旋转中心x坐标
+    :param y: (int) 旋转中心y坐标
+    :param r: (int) 顺时针旋转角度
+    :param unit: (bool) 角度单位，True为度，False为弧度
+    :return: (numpy.ndarray of float64: (3, 3)) 变换矩阵
+    """
+    if unit:
+        r = r / 180 * math.pi
+    cos_r, sin_r = math.cos(r), math.sin(r)
+    return np.array([[cos_r, -sin_r, x - x * cos_r + y * sin_r],
+                     [sin_r, cos_r, y - x * sin_r - y * cos_r],
+                     [0, 0, 1]], np.float64)
+
+
+def scaling(x, y, s):
+    """缩放变换矩阵
+
+    :param x: (int) 缩放中心x坐标
+    :param y: (int) 缩放中心y坐标
+    :param s: (float) 缩放倍数
+    :return: (numpy.ndarray of float64: (3, 3)) 变换矩阵
+    """
+    return np.array([[s, 0, x - x * s], [0, s, y - y * s], [0, 0, 1]], np.float64)
+
+
+def apply(matrix, points):
+    """将变换矩阵作用于点集
+
+    :param matrix: (numpy.ndarray: (3, 3)) 变换矩阵
+    :param points: (array-like: (N, 2)) 点坐标
+    :return: (numpy.ndarray of float64: (N, 2)) 变换后的点坐标（未取整）
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    return points @ matrix[:2, :2].T + matrix[:2, 2]
+
+
+def apply_many(matrices, points, offsets):
+    """将多个变换矩阵分别作用于对应的点集，所有点在一次向量化运算中完成
+
+    :param matrices: (numpy.ndarray: (K, 3, 3)) K个变换矩阵
+    :param points: (numpy.ndarray: (N, 2)) K个点集依次拼接而成的点坐标
+    :param offsets: (numpy.ndarray of int: (K + 1,)) 第i个点集为points[offsets[i]:offsets[i + 1]]
+    :return: (numpy.ndarray of float64: (N, 2)) 变换后的点坐标（未取整）
+    """
+    per_point = np.repeat(np.asarray(matrices, np.float64), np.diff(offsets), axis=0)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    return np.einsum('nij,nj->ni', per_point[:, :2, :2], points) + per_point[:, :2, 2]
+
+
+class DeferredTransforms:
+    """
+    为每个图元累积尚未应用的变换
+
+    每个图元保存首次变换前的原始点集与复合后的变换矩阵，只在需要图元参数时（如光栅化前）才作用于原始点集并取整，
+    因此连续多次变换不会在每一步取整时累积误差
+    """
+
+    def __init__(self):
+        self.chains = {}  # item_id -> [原始点集 (N, 2), 复合变换矩阵 (3, 3)]
+        self.changed = set()
+
+    def compose(self, item_id, p_list, matrix):
+        """在图元已有的变换之后追加变换
+
+        :param item_id: 图元ID
+        :param p_list: (list of list of int) 图元当前参数，仅在该图元尚无待应用的变换时作为原始点集
+        :param matrix: (numpy.ndarray: (3, 3)) 追加的变换矩阵
+        """
+        chain = self.chains.get(item_id)
+        if chain is None:
+            chain = self.chains[item_id] = [np.asarray(p_list, dtype=np.float64).reshape(-1, 2), np.eye(3)]
+        chain[1] = matrix @ chain[1]
+        self.changed.add(item_id)
+
+    def discard(self, item_id):
+        """丢弃图元的变换记录（图元被重新绘制，或其参数已被其它操作直接修改）"""
+        self.chains.pop(item_id, None)
+        self.changed.discard(item_id)
+
+    def resolve(self, item_ids=None):
+        """计算自上次resolve以来变换发生改变的图元的参数，变换记录保留，后续变换仍基于原始点集
+
+        :param item_ids: (iterable) 只计算这些图元，默认为全部改变的图元
+        :return: (dict: item_id -> list of list of int) 取整后的图元参数
+        """
+        ids = list(self.changed if item_ids is None else self.changed.intersection(item_ids))
+        self.changed.difference_update(ids)
+        if not ids:
+            return {}
+        offsets = np.zeros(len(ids) + 1, np.int64)
+        offsets[1:] = np.cumsum([len(self.chains[i][0]) for i in ids])
+        points = np.concatenate([self.chains[i][0] for i in ids])
+        matrices = np.stack([self.chains[i][1] for i in ids])
+        points = np.round(apply_many(matrices, points, offsets)).astype(np.int64).tolist()
+        return {item_id: points[offsets[k]:offsets[k + 1]] for k, item_id in enumerate(ids)}